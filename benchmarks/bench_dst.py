@@ -0,0 +1,203 @@
+"""
+Benchmarks of pydst on synthetic DST files.
+
+    $ python benchmarks/bench_dst.py --events 10000 --banks fraw1 hctim -o results.json
+    $ python benchmarks/bench_dst.py -o new.json --compare results.json
+
+Each benchmark is run `--repeat` times and the fastest run is reported, in events/s (or items/s) and MB/s
+(of the DST file as stored, i.e. compressed with `--suffix .gz`, and of the bank structs for convert).
+"""
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from pydst import c_to_py
+from pydst.util import bank_list, event
+
+import synthetic
+
+
+def _measure(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def _result(seconds, n, n_bytes=None, unit="events"):
+    ret = {"seconds": seconds, f"{unit}_per_s": n / seconds}
+    if n_bytes is not None:
+        ret["mb_per_s"] = n_bytes / seconds / 1e6
+    return ret
+
+
+def _consume(iterable):
+    for _ in iterable:
+        pass
+
+
+def bench_write_dst(path, events, repeat):
+    def run():
+        with event.open(path, "w") as f:
+            f.write_dst(events, show_progress=False)
+
+    seconds = _measure(run, repeat)
+    return _result(seconds, len(events), os.path.getsize(path))
+
+
+def bench_read_dst(path, n_events, repeat, return_as_numpy_array):
+    def run():
+        with event.open(path) as f:
+            _consume(f.read_dst(return_as_numpy_array=return_as_numpy_array))
+
+    return _result(_measure(run, repeat), n_events, os.path.getsize(path))
+
+
+def bench_convert(path, bank_names, n_calls, repeat):
+    with event.open(path) as f:
+        next(f.read_dst(bank_names))  # fill the global variables with an event
+
+    ret = {}
+    for bn in bank_names:
+        bank = event._get_global_variable(bn)
+
+        def run():
+            for _ in range(n_calls):
+                c_to_py.convert(bank)
+
+        ret[bn] = _result(_measure(run, repeat), n_calls, n_calls * c_to_py.get_dtype(bank).itemsize, unit="calls")
+    return ret
+
+
+def bench_lookup(n_items, repeat):
+    ids = _get_all_bank_ids()
+    names = event.get_name_from_id(ids)
+    ids = np.resize(ids, n_items)
+    names = np.resize(names, n_items)
+    return {
+        "get_id_from_name": _result(_measure(lambda: event.get_id_from_name(names), repeat), n_items, unit="items"),
+        "get_name_from_id": _result(_measure(lambda: event.get_name_from_id(ids), repeat), n_items, unit="items"),
+    }
+
+
+def _get_all_bank_ids():
+    bl = bank_list.BankList(1000)
+    bl.set_all_banks()
+    return bl.to_numpy()
+
+
+def bench_bank_list(n_iterations, repeat):
+    bl = bank_list.BankList(1000)
+    bl.set_all_banks()
+
+    def run():
+        for _ in range(n_iterations):
+            _consume(bl)
+
+    return _result(_measure(run, repeat), n_iterations * len(bl), unit="items")
+
+
+def _get_git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=pathlib.Path(__file__).parent,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp_dir:
+        path = pathlib.Path(tmp_dir) / f"synthetic.dst{args.suffix}"
+
+        synthetic.write(path, args.events, args.banks, args.fill, args.seed)
+        results["file"] = {"events": args.events, "bytes": os.path.getsize(path)}
+
+        # write_dst is measured on a copy of the events held in memory, so that the generation is not included
+        with event.open(path) as f:
+            events = next(f.read_batches(args.events, args.banks))
+        results["write_dst"] = bench_write_dst(pathlib.Path(tmp_dir) / f"written.dst{args.suffix}", events, args.repeat)
+        del events
+
+        results["read_dst_numpy"] = bench_read_dst(path, args.events, args.repeat, return_as_numpy_array=True)
+        results["read_dst_dict"] = bench_read_dst(path, args.events, args.repeat, return_as_numpy_array=False)
+        results["convert"] = bench_convert(path, args.banks, args.calls, args.repeat)
+
+    results["lookup"] = bench_lookup(args.calls, args.repeat)
+    results["bank_list_iteration"] = bench_bank_list(args.calls, args.repeat)
+
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _get_git_revision(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+
+def _flatten(results, prefix=""):
+    for k, v in results.items():
+        if isinstance(v, dict) and "seconds" not in v:
+            yield from _flatten(v, f"{prefix}{k}.")
+        elif isinstance(v, dict):
+            yield f"{prefix}{k}", v
+
+
+def print_results(report, baseline=None):
+    baseline = {} if baseline is None else dict(_flatten(baseline["results"]))
+    for name, result in _flatten(report["results"]):
+        rate_name = next(k for k in result if k.endswith("_per_s") and k != "mb_per_s")
+        line = f"{name:<40} {result[rate_name]:>14,.1f} {rate_name}"
+        if "mb_per_s" in result:
+            line += f" {result['mb_per_s']:>10.2f} MB/s"
+        if name in baseline:
+            line += f"   x{result[rate_name] / baseline[name][rate_name]:.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--banks", nargs="+", default=["fraw1"])
+    parser.add_argument("--fill", type=float, default=0.5, help="fraction of fraw1 mirrors and channels filled")
+    parser.add_argument("--suffix", default="", help="e.g. '.gz' to benchmark compressed files")
+    parser.add_argument("--calls", type=int, default=10000, help="calls of convert, lookups and BankList iterations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="directory for the temporary DST files")
+    parser.add_argument("-o", "--output", default=None, help="JSON file to save the results to")
+    parser.add_argument("--compare", default=None, help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Generate synthetic DST files through the write path of pydst.
+
+    $ python benchmarks/synthetic.py out.dst.gz --events 10000 --banks fraw1 hctim --fill 0.5
+"""
+import argparse
+
+import numpy as np
+
+from pydst.util import event
+
+
+def make_events(n_events, bank_names=("fraw1",), fill=0.5, rng=None):
+    """
+    Return a structured array of `n_events` events with `bank_names`.
+
+    fraw1 is filled with about `fill` of its mirrors and channels (1 mirror at least), and FADC traces of
+    pedestal plus uniform noise. The other banks are left zero.
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+
+    events = np.zeros(n_events, dtype=event._get_event_dtype(tuple(bank_names)))
+    if "fraw1" in bank_names:
+        _fill_fraw1(events["fraw1"], fill, rng)
+    return events
+
+
+def _fill_fraw1(fraw1, fill, rng):
+    n = len(fraw1)
+    max_mir = fraw1["mir_num"].shape[1]
+    max_chan, max_fadc = fraw1["m_fadc"].shape[2:]
+
+    num_mir = 1 + rng.binomial(max_mir - 1, fill, n)
+    mirror = np.arange(max_mir) < num_mir[:, np.newaxis]
+    num_chan = np.where(mirror, rng.binomial(max_chan, fill, (n, max_mir)), 0)
+    channel = mirror[..., np.newaxis] & (np.arange(max_chan) < num_chan[..., np.newaxis])
+
+    fraw1["event_code"] = 1
+    fraw1["site"] = 1
+    fraw1["event_num"] = np.arange(n)
+    fraw1["julian"] = 20190401
+    fraw1["jsecond"] = np.sort(rng.integers(0, 86400, n))
+    fraw1["jclkcnt"] = rng.integers(0, 1000000000, n)
+
+    fraw1["num_mir"] = num_mir
+    fraw1["mir_num"] = np.where(mirror, np.arange(1, max_mir + 1), 0)
+    fraw1["num_chan"] = num_chan
+    fraw1["clkcnt"] = np.where(mirror, rng.integers(0, 60000, (n, max_mir)), 0)
+
+    fraw1["channel"] = np.where(channel, np.arange(max_chan), 0)
+    fraw1["it0_chan"] = np.where(channel, rng.integers(0, max_fadc // 2, channel.shape), 0)
+    fraw1["nt_chan"] = np.where(channel, max_fadc, 0)
+    # generated as int8 since m_fadc is large for real fraw1 dimensions, and written through an int8 view since
+    # m_fadc is char (S1), to which assigning integers would store their decimal digits
+    fadc = rng.integers(25, 36, fraw1["m_fadc"].shape, dtype=np.int8)
+    fraw1["m_fadc"].view("i1")[...] = np.where(channel[..., np.newaxis], fadc, 0)
+
+
+def write(path, n_events, bank_names=("fraw1",), fill=0.5, seed=0, batch_size=100):
+    """Write `n_events` synthetic events to `path` in batches of `batch_size`."""
+    rng = np.random.default_rng(seed)
+    with event.open(path, "w") as f:
+        for start in range(0, n_events, batch_size):
+            f.write_dst(make_events(min(batch_size, n_events - start), bank_names, fill, rng), show_progress=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--banks", nargs="+", default=["fraw1"])
+    parser.add_argument("--fill", type=float, default=0.5, help="fraction of fraw1 mirrors and channels filled")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write(args.path, args.events, args.banks, args.fill, args.seed)
+
+
+if __name__ == "__main__":
+    main()
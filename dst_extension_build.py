@@ -5,8 +5,13 @@ import pycparser.c_generator
 import re
 import numpy as np
 import collections
-import inspect
+import concurrent.futures
+import functools
+import hashlib
+import pickle
+import shutil
 import subprocess
+import tempfile
 import os
 
 
@@ -90,13 +95,53 @@ implied_includes = ["stdlib.h", dst_standard_types_header]
 
 invalid_func_names, invalid_headers = _get_invalids()
 
-total_header = sum(1 for h in (p.name for p in include_dir_path.glob("*.h")) if h not in invalid_headers)
+build_cache_env_variable = "PYDST_BUILD_CACHE_DIR"
 
+banks_env_variable = "PYDST_BANKS"
 
-def get_n_recursively_called(skip=0):
-    stack = inspect.stack()
-    frame = stack[1 + skip][0]
-    return sum(1 for parent_frame, *_ in stack[2 + skip:] if parent_frame.f_code == frame.f_code)
+core_module_name = "pydst._dst_cffi"
+bank_module_prefix = "_dst_bank_"
+
+
+def get_build_cache_dir():
+    if build_cache_env_variable in os.environ:
+        return pathlib.Path(os.environ[build_cache_env_variable])
+    # pip installはビルドのたびに新しい一時ディレクトリで行うので、ソースツリーの外 (ユーザーごと) に置く
+    return pathlib.Path.home() / ".cache" / "pydst" / "build"
+
+
+def _hash(*texts):
+    m = hashlib.sha256()
+    for t in texts:
+        m.update(t.encode())
+        m.update(b"\0")
+    return m.hexdigest()
+
+
+def _cached(kind, key, compute):
+    path = get_build_cache_dir() / kind / key
+    if path.exists():
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    value = compute()
+
+    # 他のプロセスが読みかけのファイルを見ないように、一時ファイルに書いてから置き換える
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def _read(path):
+    return "".join(line for line in open(path))
 
 
 def preprocess_file(path):
@@ -117,7 +162,7 @@ def get_txt_std_header(name):
 
 def get_txt(h, separate_includes=False):
     if (include_dir_path / h).exists():
-        txt = "".join(line for line in open(include_dir_path / h))
+        txt = _read(include_dir_path / h)
 
         includes = implied_includes.copy()
         if h in includes:
@@ -128,7 +173,7 @@ def get_txt(h, separate_includes=False):
         else:
             return "\n".join((*(f'#include "{h}"' for h in includes), txt))
     elif (fake_libc_path / h).exists():
-        txt = "".join(l for l in open(fake_libc_path / h))
+        txt = _read(fake_libc_path / h)
         if separate_includes:
             return txt, []
         else:
@@ -137,6 +182,7 @@ def get_txt(h, separate_includes=False):
         raise FileNotFoundError(h)
 
 
+@functools.lru_cache(maxsize=None)
 def get_all_header_dependencies(h, return_flatten=False):
     txt = get_txt(h)
 
@@ -187,7 +233,7 @@ def get_all_header_dependencies(h, return_flatten=False):
                 )
             )).keys())
         else:
-            return []
+            return ()
     else:
         if len(other_headers) > 0:
             return {
@@ -198,85 +244,160 @@ def get_all_header_dependencies(h, return_flatten=False):
             return None
 
 
-def parse_header(h, ext={}, debug=False, remove_dependencies=True, show=False):
-    def print_debug(*s, **kwargs):
-        print(f"[DEBUG] {'    ' * get_n_recursively_called(1)}", *s, **kwargs)
-
-    if debug:
-        print_debug(h)
-
-    if h in ext:
-        if debug:
-            print_debug(f"{h} already in ext")
-        return None
-
+def get_preprocess_input(h):
     txt, includes = get_txt(h, separate_includes=True)
+    includes = [*includes, *reversed(get_all_header_dependencies(h, return_flatten=True))]
+    return "\n".join((*(f'#include "{h}"' for h in includes), txt))
 
-    other_headers = get_all_header_dependencies(h, return_flatten=True)
-    includes.extend(reversed(other_headers))
-
-    txt = "\n".join((*(f'#include "{h}"' for h in includes), txt))
-
-    if debug:
-        print_debug(h, other_headers)
 
-    txt = preprocess_text(txt, [f"-I{fake_libc_path}", f"-I{include_dir_path}"])
+def get_parse_order(headers):
+    # 依存先のヘッダーが先に並ぶようにする
+    order = {}
 
-    ast = parser.parse(txt, include_dir_path / h)
+    def visit(h):
+        if h not in order:
+            for oh in get_all_header_dependencies(h, return_flatten=True):
+                visit(oh)
+            order[h] = None
 
-    if remove_dependencies:
-        skip_length = 0
-        if len(other_headers) > 0:
-            if remove_dependencies:
-                skip_length = sum(
-                    len(parse_header(oh, ext, debug, remove_dependencies=True)) if oh not in ext else len(ext[oh])
-                    for oh in other_headers
-                )
-            else:
-                skip_length = sum(
-                    len(parse_header(oh, ext, debug, remove_dependencies=False)) if oh not in ext else len(ext[oh])
-                    for oh in other_headers
-                )
+    for h in headers:
+        visit(h)
+    return list(order)
 
-        if debug:
-            print_debug(f"{h}, {skip_length = }")
-        ext[h] = ast.ext[skip_length:]
-    else:
-        ext[h] = ast.ext
 
-    print(f"read headers {len(ext):>3} / {total_header}\r", end="")
+def preprocess_headers(headers, max_workers=None):
+    opts = [f"-I{fake_libc_path}", f"-I{include_dir_path}"]
 
-    # if show:
-    #     print(g.visit(pycparser.c_ast.FileAST(ext[h])))
-    return ext[h]
+    def preprocess(h):
+        txt = get_preprocess_input(h)
+        # インクルードされるヘッダーの中身もキーに含める
+        key = _hash(txt, *opts, *(get_txt(oh) for oh in get_all_header_dependencies(h, return_flatten=True)))
+        return _cached("preprocessed", key, lambda: preprocess_text(txt, opts))
 
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return dict(zip(headers, executor.map(preprocess, headers)))
 
-def build():
-    print(f"* Received Environment Variable '{env_variable}' as {dst2k_path}")
 
-    # if not build_path.exists():
-    #     raise RuntimeWarning(f"do not run {__file__} directly at first.")
+def _parse(item):
+    h, txt = item
+    return _cached("ast", _hash(h, txt, pycparser.__version__), lambda: parser.parse(txt, include_dir_path / h).ext)
 
-    bank_header_names = [
-        h for h in (c.with_suffix(".h").name for c in src_bank_path.glob("*.c")) if h not in invalid_headers
-    ]
 
-    other_header_names = [
-        h.name for h in include_dir_path.glob("*.h")
-        if (h.name not in bank_header_names) and (h.name not in invalid_headers)
-    ]
-    other_header_names.insert(0, other_header_names.pop(other_header_names.index(dst_standard_types_header)))
+def parse_headers(preprocessed, max_workers=None):
+    """Parse preprocessed headers in parallel and remove the declarations coming from their dependencies."""
+    full_ext = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        for h, ext in zip(preprocessed, executor.map(_parse, preprocessed.items())):
+            full_ext[h] = ext
+            print(f"read headers {len(full_ext):>3} / {len(preprocessed)}\r", end="")
 
+    # preprocessedは依存先が先に並んでいる
     all_ext = {}
-    for h in (p.name for p in include_dir_path.glob("*.h")):
-        if h not in invalid_headers:
-            parse_header(h, all_ext)
-
+    for h in preprocessed:
+        skip_length = sum(len(all_ext[oh]) for oh in get_all_header_dependencies(h, return_flatten=True))
+        all_ext[h] = full_ext[h][skip_length:]
+    return all_ext
+
+
+# BankListを一回のFFI呼び出しでまとめて操作するためのヘルパーと、イベントをコピーするヘルパーなど
+helper_cdefs = """
+int pydst_addBankListArray(int list, int *banks, int n);
+int pydst_getBankListArray(int list, int *banks, int size);
+int pydst_tstBankListArray(int list, int *banks, int *found, int n);
+int pydst_copyEvents(int in_unit, int out_unit, int want, int got, integer4 *event, int *n_read, int *n_written);
+int pydst_getMaxUnits(void);
+"""
+
+helper_source = """
+static int pydst_addBankListArray(int list, int *banks, int n) {
+    int i;
+    for (i = 0; i < n; i++) {
+        addBankList(list, banks[i]);
+    }
+    return cntBankList(list);
+}
+
+static int pydst_getBankListArray(int list, int *banks, int size) {
+    int n = 0, itr = 0, bank;
+    while (n < size && (bank = itrBankList(list, &itr)) != 0) {
+        banks[n++] = bank;
+    }
+    return n;
+}
+
+static int pydst_tstBankListArray(int list, int *banks, int *found, int n) {
+    int i, itr = 0, bank, n_found = 0;
+    for (i = 0; i < n; i++) {
+        found[i] = 0;
+    }
+    while ((bank = itrBankList(list, &itr)) != 0) {
+        for (i = 0; i < n; i++) {
+            if (!found[i] && banks[i] == bank) {
+                found[i] = 1;
+                n_found++;
+            }
+        }
+    }
+    return n_found;
+}
+
+/* eventReadで読んだイベントをそのままeventWriteで書く (バンクが無いイベントは書かない) */
+static int pydst_copyEvents(int in_unit, int out_unit, int want, int got, integer4 *event, int *n_read, int *n_written) {
+    int rc;
+    *n_read = 0;
+    *n_written = 0;
+    while (1) {
+        rc = eventRead(in_unit, want, got, event);
+        if (*event == 0 || rc <= 0) {
+            return rc;
+        }
+        (*n_read)++;
+        if (cntBankList(got) > 0) {
+            eventWrite(out_unit, got, 1);
+            (*n_written)++;
+        }
+    }
+}
+
+/* dst2kのユニット番号の上限 (ユニット番号は0からこれ未満、分からなければ0) */
+static int pydst_getMaxUnits(void) {
+#ifdef MAX_DST_FILE_UNITS
+    return MAX_DST_FILE_UNITS;
+#else
+    return 0;
+#endif
+}
+"""
+
+
+def get_bank_name(h):
+    return h[:-len("_dst.h")] if h.endswith("_dst.h") else pathlib.Path(h).stem
+
+
+def get_wanted_bank_headers(bank_header_names):
+    """Return the bank headers listed in PYDST_BANKS (comma-separated bank names) and the bank headers they need."""
+    if banks_env_variable not in os.environ:
+        return bank_header_names
+
+    wanted = {bn.strip() for bn in os.environ[banks_env_variable].split(",") if bn.strip() != ""}
+    unknown = wanted - {get_bank_name(h) for h in bank_header_names}
+    if len(unknown) > 0:
+        raise ValueError(f"unknown banks in {banks_env_variable}: {', '.join(sorted(unknown))}")
+
+    wanted_headers = {h for h in bank_header_names if get_bank_name(h) in wanted}
+    wanted_headers |= {
+        oh
+        for h in wanted_headers
+        for oh in get_all_header_dependencies(h, return_flatten=True)
+        if oh in bank_header_names
+    }
+    return [h for h in bank_header_names if h in wanted_headers]
+
+
+def _generate_cdefs(all_ext, bank_header_names, other_header_names):
     bank_ext = {k: all_ext[k] for k in (h for h in all_ext.keys() if h in bank_header_names)}
     other_ext = {k: all_ext[k] for k in other_header_names if k not in bank_header_names}
 
-    # ext to cdef
-
     g = pycparser.c_generator.CGenerator()
 
     std_types_cdefs = g.visit(pycparser.c_ast.FileAST([
@@ -290,25 +411,31 @@ def build():
         if not (isinstance(e.type, pycparser.c_ast.TypeDecl) and e.name == "FILE")
     ]))
 
-    bank_cdefs = g.visit(pycparser.c_ast.FileAST([
-        e for ext in bank_ext.values() for e in ext
-        # 実体が定義されていないものを除外
-        if not (isinstance(e.type, pycparser.c_ast.FuncDecl) and e.name in [
-            # 全く無い (inc/atmpar_dst.h)
-            "atmpar_h2mo", "atmpar_h2mo_deriv", "atmpar_mo2h",
-            # 全く無い (inc/hpkt1_dst.h)
-            "hpkt1_common_to_hraw1_",
-            # 全く無い (inc/tadaq_dst.h)
-            "tadaq_time_fprint", "tadaq_time_print_",
-            # 全く無い (inc/tasdmonitor_dst.h)
-            "tasdmonitor_dst_to_common_",
-            # 全く無い (inc/tlmsnp_dst.h)
-            "tlmsnp_time_fprint", "tlmsnp_time_print_",
-
-            # _で終わる名前なら定義されてる (inc/fraw1_dst.h, src/bank/lib/fraw1_dst.c),
-            "fraw1_time_fprint",
-        ])
-    ]))
+    # 実体が定義されていないものを除外
+    bank_invalid_func_names = [
+        # 全く無い (inc/atmpar_dst.h)
+        "atmpar_h2mo", "atmpar_h2mo_deriv", "atmpar_mo2h",
+        # 全く無い (inc/hpkt1_dst.h)
+        "hpkt1_common_to_hraw1_",
+        # 全く無い (inc/tadaq_dst.h)
+        "tadaq_time_fprint", "tadaq_time_print_",
+        # 全く無い (inc/tasdmonitor_dst.h)
+        "tasdmonitor_dst_to_common_",
+        # 全く無い (inc/tlmsnp_dst.h)
+        "tlmsnp_time_fprint", "tlmsnp_time_print_",
+
+        # _で終わる名前なら定義されてる (inc/fraw1_dst.h, src/bank/lib/fraw1_dst.c),
+        "fraw1_time_fprint",
+    ]
+
+    # バンク毎に別のモジュールにする
+    bank_cdefs = {
+        h: g.visit(pycparser.c_ast.FileAST([
+            e for e in ext
+            if not (isinstance(e.type, pycparser.c_ast.FuncDecl) and e.name in bank_invalid_func_names)
+        ]))
+        for h, ext in bank_ext.items()
+    }
 
     other_cdefs = g.visit(pycparser.c_ast.FileAST([
         e for ext in other_ext.values() for e in ext
@@ -317,39 +444,100 @@ def build():
         if not (isinstance(e.type, pycparser.c_ast.FuncDecl) and e.name in invalid_func_names)
     ]))
 
+    return std_types_cdefs, other_cdefs, bank_cdefs
+
+
+def build():
+    print(f"* Received Environment Variable '{env_variable}' as {dst2k_path}")
+
+    # if not build_path.exists():
+    #     raise RuntimeWarning(f"do not run {__file__} directly at first.")
+
+    bank_header_names = [
+        h for h in (c.with_suffix(".h").name for c in src_bank_path.glob("*.c")) if h not in invalid_headers
+    ]
+
+    other_header_names = [
+        h.name for h in include_dir_path.glob("*.h")
+        if (h.name not in bank_header_names) and (h.name not in invalid_headers)
+    ]
+    other_header_names.insert(0, other_header_names.pop(other_header_names.index(dst_standard_types_header)))
+
+    headers = get_parse_order(h for h in (p.name for p in include_dir_path.glob("*.h")) if h not in invalid_headers)
+    preprocessed = preprocess_headers(headers)
+
+    # 全てのヘッダーが前回と同じならパースせずにcdefを再利用する
+    key = _hash(
+        *preprocessed, *preprocessed.values(), "|", *bank_header_names, "|", *other_header_names,
+        pycparser.__version__, _read(pathlib.Path(__file__).resolve())
+    )
+    std_types_cdefs, other_cdefs, bank_cdefs = _cached("cdefs", key, lambda: _generate_cdefs(
+        parse_headers(preprocessed), bank_header_names, other_header_names
+    ))
+
+    wanted_bank_headers = get_wanted_bank_headers([h for h in headers if h in bank_cdefs])
+
     dst_includes = "\n".join(f'#include "{include_dir_path / f}"' for f in other_header_names)
 
+    build_path = _current_path/"build"
+    if build_path.exists():
+        lib_dir = build_path/"lib"/"pydst"
+    else:
+        print(f"Info: {build_path} not found")
+        print("Info: moves the extension modules to pydst/")
+        lib_dir = _current_path/"pydst"
+
+    # 前回のビルドで作られたバンクのモジュールを消す
+    for p in lib_dir.glob(f"{bank_module_prefix}*"):
+        p.unlink()
+
+    # I/O、BankListなどのコアの部分
     ffi_builder = FFI()
     ffi_builder.cdef(std_types_cdefs)
     ffi_builder.cdef(other_cdefs, override=True)  # TODO: should be override=False
     # ffi_builder.cdef(other_cdefs)
-    ffi_builder.cdef(bank_cdefs)
-
-    target_fn = "_dst_cffi"
+    ffi_builder.cdef(helper_cdefs)
 
     ffi_builder.set_source(
-        target_fn, dst_includes,
+        core_module_name, "\n".join((dst_includes, helper_source)),
         include_dirs=[str(include_dir_path)],
         library_dirs=[str(lib_dir_path)],
         libraries=['dst2k', "bz2", "m", "c", "z"]
     )
+    _compile(ffi_builder, lib_dir)
+
+    # バンク毎のモジュール (pydst/_dst.pyで初めて使われた時に読み込まれる)
+    # バンクの変数や関数の実体はコアのモジュールにリンクされているものを使う
+    bank_builders = {}
+    for h in wanted_bank_headers:
+        bank_builder = FFI()
+        bank_builder.include(ffi_builder)
+        for oh in get_all_header_dependencies(h, return_flatten=True):
+            if oh in bank_builders:
+                bank_builder.include(bank_builders[oh])
+        bank_builder.cdef(bank_cdefs[h])
+
+        bank_builder.set_source(
+            f"pydst.{bank_module_prefix}{get_bank_name(h)}",
+            "\n".join((
+                dst_includes,
+                *(
+                    f'#include "{include_dir_path / oh}"'
+                    for oh in reversed(get_all_header_dependencies(h, return_flatten=True))
+                    if (include_dir_path / oh).exists()
+                ),
+                f'#include "{include_dir_path / h}"'
+            )),
+            include_dirs=[str(include_dir_path)]
+        )
+        _compile(bank_builder, lib_dir)
+        bank_builders[h] = bank_builder
 
-    ffi_builder.compile(verbose=True)
-    p = pathlib.Path(target_fn)
-    p.with_suffix(".o").unlink()
-    p.with_suffix(".c").unlink()
-
-    lib_paths = list(pathlib.Path(_current_path).glob(f"{target_fn}.*"))
-    assert len(lib_paths) == 1
-    lib_path = lib_paths[0]
 
-    build_path = _current_path/"build"
-    if build_path.exists():
-        lib_path.rename(build_path/"lib"/"pydst"/lib_path.name)
-    else:
-        print(f"Info: {build_path} not found")
-        print(f"Info: moved {lib_path.name} to pydst/")
-        lib_path.rename(_current_path/"pydst"/lib_path.name)
+def _compile(ffi_builder, lib_dir):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lib_path = pathlib.Path(ffi_builder.compile(tmpdir=tmp_dir, verbose=True))
+        shutil.move(lib_path, lib_dir/lib_path.name)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 try:
-    from . import _dst_cffi as dst
+    from . import _dst as dst
 except ImportError:
     import sys
     print(f"Run pydst/dst_extension_build.py first. (__file__={__file__})", file=sys.stderr)
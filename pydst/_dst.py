@@ -0,0 +1,85 @@
+import importlib
+import os
+import pkgutil
+import sys
+import types
+
+
+__all__ = ["ffi", "lib", "loaded_bank_names"]
+
+
+# The bank modules have no copy of dst2k, and resolve the bank variables and functions against the core module.
+_flags = sys.getdlopenflags()
+sys.setdlopenflags(_flags | os.RTLD_GLOBAL)
+try:
+    from . import _dst_cffi as _core
+finally:
+    sys.setdlopenflags(_flags)
+
+ffi = _core.ffi
+
+_bank_module_prefix = "_dst_bank_"
+
+# bank name -> module name, longest names first so that e.g. 'hraw1x' is tried before 'hraw1'
+_bank_modules = {
+    m.name[len(_bank_module_prefix):]: m.name
+    for m in sorted(
+        pkgutil.iter_modules([os.path.dirname(__file__)]),
+        key=lambda m: -len(m.name)
+    )
+    if m.name.startswith(_bank_module_prefix)
+}
+
+_bank_libs = {}
+
+
+def _load_bank(bank_name):
+    if bank_name not in _bank_libs:
+        _bank_libs[bank_name] = importlib.import_module(f"{__package__}.{_bank_modules[bank_name]}").lib
+    return _bank_libs[bank_name]
+
+
+def loaded_bank_names():
+    return list(_bank_libs)
+
+
+class _Lib:
+    """
+    `lib` of the core module, which also gives the variables and functions of banks, such as fraw1_, by loading
+    the module of the bank on first access.
+    """
+
+    def __init__(self):
+        self._owners = {}  # name -> lib having it, or None if no lib has it
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        if name not in self._owners:
+            self._owners[name] = self._find_owner(name)
+        owner = self._owners[name]
+        if owner is None:
+            raise AttributeError(f"pydst has no '{name}' (or its bank is not built)")
+
+        value = getattr(owner, name)
+        if isinstance(value, types.BuiltinFunctionType):
+            # Functions never change, so later lookups skip __getattr__. Variables are read from the lib every time.
+            setattr(self, name, value)
+        return value
+
+    def _find_owner(self, name):
+        if hasattr(_core.lib, name):
+            return _core.lib
+        for bank_name in _bank_modules:
+            if name.startswith(bank_name):
+                bank_lib = _load_bank(bank_name)
+                if hasattr(bank_lib, name):
+                    return bank_lib
+        return None
+
+    def __dir__(self):
+        return [*dir(_core.lib), *(n for bank_lib in _bank_libs.values() for n in dir(bank_lib))]
+
+
+lib = _Lib()
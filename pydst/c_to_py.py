@@ -1,5 +1,5 @@
 import numpy as np
-from . import _dst_cffi as dst
+from . import _dst as dst
 import re
 
 
@@ -14,13 +14,89 @@ _c_data_types = {
 }
 
 table = {
-    k: np.dtype(f"{kind}{dst.ffi.alignof(k)}" if kind in ("i", "S", "U", "f") else kind)
+    k: np.dtype(f"{kind}{dst.ffi.sizeof(k)}" if kind in ("i", "S", "U", "f") else kind)
     for k, kind in _c_data_types.items()
 }
 
+# C type of bank -> structured dtype with the same memory layout
+_dtype_registry = {}
 
-def convert(bank):
-    return {attr: convert_to_pyobject(getattr(bank, attr)) for attr in dir(bank)}
+
+def get_dtype(bank):
+    """
+    Return a structured dtype whose field offsets and itemsize match the C struct of `bank`.
+    It is built once per struct type and cached afterwards.
+    """
+    type_ = dst.ffi.typeof(bank)
+    if type_ not in _dtype_registry:
+        _dtype_registry[type_] = _to_dtype(type_)
+    return _dtype_registry[type_]
+
+
+def _to_dtype(type_):
+    if type_.kind == "primitive":
+        return table[type_.cname]
+    elif type_.kind == "array":
+        return np.dtype((_to_dtype(type_.item), (type_.length,)))
+    elif type_.kind == "struct":
+        names, formats, offsets = [], [], []
+        for name, field in type_.fields:
+            if field.bitsize != -1:
+                raise NotImplementedError(f"bit field '{name}' in {type_.cname}")
+            names.append(name)
+            formats.append(_to_dtype(field.type))
+            offsets.append(field.offset)
+        return np.dtype({
+            "names": names, "formats": formats, "offsets": offsets, "itemsize": dst.ffi.sizeof(type_)
+        })
+    else:
+        raise NotImplementedError(type_.kind)
+
+
+_projected_dtype_registry = {}
+
+
+def get_projected_dtype(bank, fields):
+    """
+    Return (dtype of `fields` at their offsets in the C struct of `bank`, packed dtype of `fields`).
+    The former views only `fields` in the struct, and the latter is the narrower dtype to copy them into.
+    """
+    key = (dst.ffi.typeof(bank), tuple(fields))
+    if key not in _projected_dtype_registry:
+        dtype = get_dtype(bank)
+        for f in fields:
+            if f not in dtype.names:
+                raise KeyError(f"no field '{f}' in {dst.ffi.typeof(bank).cname}")
+        _projected_dtype_registry[key] = (
+            np.dtype({
+                "names": list(fields),
+                "formats": [dtype.fields[f][0] for f in fields],
+                "offsets": [dtype.fields[f][1] for f in fields],
+                "itemsize": dtype.itemsize
+            }),
+            np.dtype([(f, dtype.fields[f][0]) for f in fields])
+        )
+    return _projected_dtype_registry[key]
+
+
+def view(bank, fields=None):
+    """Return a 0-d structured array sharing its memory with the struct `bank` (no copy), optionally projected."""
+    dtype = get_dtype(bank) if fields is None else get_projected_dtype(bank, fields)[0]
+    return np.frombuffer(dst.ffi.buffer(dst.ffi.addressof(bank)), dtype=dtype, count=1).reshape(())
+
+
+def to_numpy(bank, fields=None):
+    """Copy the struct `bank` (only `fields` if given) into a 0-d structured array with a single copy."""
+    if fields is None:
+        return view(bank).copy()
+    ret = np.empty((), dtype=get_projected_dtype(bank, fields)[1])
+    ret[()] = view(bank, fields)
+    return ret
+
+
+def convert(bank, fields=None):
+    row = to_numpy(bank, fields)
+    return {attr: row[attr] for attr in row.dtype.names}
 
 
 def convert_to_pyobject(obj):
@@ -35,4 +111,3 @@ def convert_to_pyobject(obj):
             raise NotImplementedError(type_.kind)
     else:
         return obj
-
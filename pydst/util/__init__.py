@@ -1,5 +1,13 @@
 from . import bank_list
 from . import event
 from . import banks
+from . import views
+from . import compression
+from . import cache
+from . import stats
+from . import units
+from . import merge
+from . import shard
+from . import arrow
 
-__all__ = ["bank_list", "event", "banks"]
+__all__ = ["bank_list", "event", "banks", "views", "compression", "cache", "stats", "units", "merge", "shard", "arrow"]
@@ -0,0 +1,133 @@
+import contextlib
+
+import numpy as np
+
+from . import event
+
+
+__all__ = ["to_arrow_type", "to_arrow_array", "record_batches", "write_parquet", "write_ipc"]
+
+
+def _import_pyarrow():
+    # pyarrow is optional, and imported only when the banks are exported
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required to export DST banks to Arrow or Parquet") from None
+    return pyarrow
+
+
+def to_arrow_type(dtype):
+    """
+    Return the Arrow type of a bank dtype: structs for structs, fixed-size lists for arrays, uint8 for char and
+    primitive types for the others.
+    """
+    pa = _import_pyarrow()
+    dtype = np.dtype(dtype)
+
+    if dtype.subdtype is not None:
+        base, shape = dtype.subdtype
+        type_ = to_arrow_type(base)
+        for n in reversed(shape):
+            type_ = pa.list_(type_, n)
+        return type_
+    elif dtype.names is not None:
+        return pa.struct([(name, to_arrow_type(dtype[name])) for name in dtype.names])
+    elif dtype == np.dtype("S1"):
+        # char (integer1) holds FADC samples, e.g. fraw1 m_fadc, rather than text in most banks
+        return pa.uint8()
+    elif dtype.kind == "S":
+        return pa.binary(dtype.itemsize)
+    else:
+        return pa.from_numpy_dtype(dtype)
+
+
+def to_arrow_array(values: np.ndarray):
+    """Convert a 1-d array of a bank dtype (or of one of its fields) to an Arrow array."""
+    pa = _import_pyarrow()
+
+    if values.ndim > 1:
+        # fixed-size arrays in C structs: the innermost dimension is the innermost list
+        inner = to_arrow_array(values.reshape(-1, *values.shape[2:]))
+        return pa.FixedSizeListArray.from_arrays(inner, values.shape[1])
+    elif values.dtype.names is not None:
+        return pa.StructArray.from_arrays(
+            [to_arrow_array(values[name]) for name in values.dtype.names], names=list(values.dtype.names)
+        )
+    elif values.dtype == np.dtype("S1"):
+        return pa.array(np.ascontiguousarray(values).view(np.uint8))
+    elif values.dtype.kind == "S":
+        data = pa.py_buffer(np.ascontiguousarray(values).tobytes())
+        return pa.FixedSizeBinaryArray.from_buffers(pa.binary(values.dtype.itemsize), len(values), [None, data])
+    else:
+        return pa.array(np.ascontiguousarray(values))
+
+
+@contextlib.contextmanager
+def _open(file):
+    if isinstance(file, event.DSTIOWrapper):
+        yield file
+    else:
+        with event.open(file) as f:
+            yield f
+
+
+def record_batches(file, want_bank_names=None, batch_size=10000, where=None, fields=None):
+    """
+    Read a DST file (a path or a DSTIOWrapper opened for reading) and yield Arrow record batches of up to
+    `batch_size` events, with one struct column per bank.
+
+    The events are read by read_batches(batch_size, want_bank_names, where, fields), so banks missing in an
+    event are zero-filled.
+    """
+    pa = _import_pyarrow()
+    with _open(file) as f:
+        for batch in f.read_batches(batch_size, want_bank_names, where, fields):
+            yield pa.RecordBatch.from_arrays(
+                [to_arrow_array(batch[bn]) for bn in batch.dtype.names], names=list(batch.dtype.names)
+            )
+
+
+def _get_empty_schema(want_bank_names, fields):
+    pa = _import_pyarrow()
+    dtype = event._get_event_dtype(tuple(want_bank_names or ()), fields)
+    return pa.schema([(bn, to_arrow_type(dtype[bn])) for bn in dtype.names])
+
+
+def _write(new_writer, file, path, want_bank_names, batch_size, where, fields):
+    writer = None
+    try:
+        for rb in record_batches(file, want_bank_names, batch_size, where, fields):
+            if writer is None:
+                writer = new_writer(path, rb.schema)
+            writer.write_batch(rb)
+        if writer is None:
+            writer = new_writer(path, _get_empty_schema(want_bank_names, fields))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_parquet(file, path, want_bank_names=None, batch_size=10000, where=None, fields=None, **kwargs):
+    """
+    Export a DST file to a Parquet file at `path`, one row group per `batch_size` events, streaming the events
+    as in record_batches. `kwargs` are passed to pyarrow.parquet.ParquetWriter (e.g. compression="zstd").
+    """
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+    _write(
+        lambda p, schema: pq.ParquetWriter(p, schema, **kwargs),
+        file, path, want_bank_names, batch_size, where, fields
+    )
+
+
+def write_ipc(file, path, want_bank_names=None, batch_size=10000, where=None, fields=None, **kwargs):
+    """
+    Export a DST file to an Arrow IPC (Feather v2) file at `path`, one record batch per `batch_size` events,
+    streaming the events as in record_batches. `kwargs` are passed to pyarrow.ipc.new_file.
+    """
+    pa = _import_pyarrow()
+    _write(
+        lambda p, schema: pa.ipc.new_file(p, schema, **kwargs),
+        file, path, want_bank_names, batch_size, where, fields
+    )
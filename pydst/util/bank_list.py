@@ -1,9 +1,12 @@
+import collections
+import collections.abc
+import contextlib
 import numpy as np
-from .. import _dst_cffi as dst
+from .. import _dst as dst
 from typing import Iterable
 
 
-__all__ = ["BankList"]
+__all__ = ["BankList", "borrow"]
 
 
 class BankList:
@@ -19,7 +22,10 @@ class BankList:
         return dst.lib.cntBankList(self._bank_id)
 
     def __iter__(self):
-        return BankListIterator(self._bank_id)
+        return iter(self.to_numpy().tolist())
+
+    def __contains__(self, bank: int):
+        return bool(self.isin([bank])[0])
 
     def __str__(self):
         return str(self.to_numpy())
@@ -27,15 +33,31 @@ class BankList:
     def __repr__(self):
         return f"BankList({self})"
 
+    @classmethod
+    def _to_array(cls, bank_list: Iterable[int]):
+        if isinstance(bank_list, (np.ndarray, collections.abc.Sequence)):
+            return np.ascontiguousarray(bank_list, dtype=cls.element_type)
+        return np.fromiter(bank_list, dtype=cls.element_type)  # generators, sets, etc.
+
     def to_numpy(self):
-        return np.fromiter(self, dtype=self.element_type)
+        ret = np.empty(len(self), dtype=self.element_type)
+        n = dst.lib.pydst_getBankListArray(self._bank_id, dst.ffi.from_buffer("int[]", ret), len(ret))
+        return ret[:n]
+
+    def isin(self, bank_list: Iterable[int]):
+        banks = self._to_array(bank_list)
+        found = np.empty(len(banks), dtype=self.element_type)
+        dst.lib.pydst_tstBankListArray(
+            self._bank_id, dst.ffi.from_buffer("int[]", banks), dst.ffi.from_buffer("int[]", found), len(banks)
+        )
+        return found.astype(bool)
 
     def append(self, bank: int):
         dst.lib.addBankList(self._bank_id, bank)
 
     def extend(self, bank_list: Iterable[int]):
-        for bank in bank_list:
-            self.append(bank)
+        banks = self._to_array(bank_list)
+        dst.lib.pydst_addBankListArray(self._bank_id, dst.ffi.from_buffer("int[]", banks), len(banks))
 
     def clear(self):
         dst.lib.clrBankList(self._bank_id)
@@ -44,20 +66,19 @@ class BankList:
         dst.lib.eventAllBanks(self._bank_id)
 
 
-class BankListIterator:
-    def __init__(self, bank_id):
-        self._n = dst.ffi.new("int *")
-        self._bank_id = bank_id
+_pool = collections.defaultdict(list)
 
-    def __del__(self):
-        dst.ffi.release(self._n)
 
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        ret = dst.lib.itrBankList(self._bank_id, self._n)
-        if ret == 0:
-            raise StopIteration
-        else:
-            return ret
\ No newline at end of file
+@contextlib.contextmanager
+def borrow(size):
+    """Borrow an empty BankList of `size` from a pool, and give it back on exit."""
+    pool = _pool[size]
+    try:
+        bl = pool.pop()  # atomic, unlike checking the length first, since the pool is shared with other threads
+    except IndexError:
+        bl = BankList(size)
+    try:
+        bl.clear()
+        yield bl
+    finally:
+        pool.append(bl)
@@ -1,3 +1,29 @@
+import numpy as np
 from . import fraw1
 
-__all__ = ["fraw1"]
+__all__ = ["fraw1", "dumpers", "dump"]
+
+
+# bank name -> function writing a bank as text to a file object
+dumpers = {
+    "fraw1": fraw1.dump,
+}
+
+
+def dump(bank_name, bank, file):
+    """Write `bank` as text to the file object `file`, with the dumper of `bank_name` if any."""
+    if bank_name in dumpers:
+        dumpers[bank_name](bank, file)
+    else:
+        _dump_fields(bank_name, bank, file)
+
+
+def _dump_fields(bank_name, bank, file):
+    lines = [f"{bank_name} :"]
+    for name in bank.dtype.names:
+        values = np.asarray(bank[name])
+        if values.dtype.kind == "S":
+            values = values.view("u1")
+        lines.append(f"  {name} = {' '.join(map(str, values.ravel().tolist()))}")
+    lines.append("")
+    file.write("\n".join(lines))
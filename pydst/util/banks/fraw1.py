@@ -1,110 +1,107 @@
-import builtins
-import more_itertools
+import sys
 import numpy as np
 
 
-__all__ = ["get_datetime_at_mirror", "print"]
+__all__ = ["get_datetime_at_mirror", "get_datetimes_at_mirror", "get_ns_at_mirror", "dump", "print"]
 
 
 def get_datetime_at_mirror(fraw1_, i_mirror=0):
-    Y, m, d, H, M, S, nanosecond = _get_sep_datetime_at_mirror(fraw1_, i_mirror)
-    return np.datetime64(f"{Y}-{m:02}-{d:02}T{H:02}:{M:02}:{S:02}.{nanosecond:09}")
+    return get_datetimes_at_mirror(fraw1_, i_mirror)[()]
 
 
-def _get_sep_datetime_at_mirror(fraw1_, i_mirror):
-    Y = fraw1_["julian"] // 10000
-    m = (fraw1_["julian"] // 100) % 100
-    d = fraw1_["julian"] % 100
+def get_datetimes_at_mirror(fraw1_, i_mirror=0):
+    """
+    Vectorized get_datetime_at_mirror over a structured array of fraw1 rows.
+    `i_mirror` is a mirror index or an array of them broadcast against the rows. Returns datetime64[ns].
+    """
+    return get_ns_at_mirror(fraw1_, i_mirror).astype("datetime64[ns]")
 
-    _total_seconds = fraw1_["jsecond"]
-    if i_mirror == 0 and fraw1_["num_mir"] == 0:
-        nanosecond = 0
-    elif 0 <= i_mirror < fraw1_["num_mir"]:
-        _total_seconds += fraw1_["second"][..., i_mirror]
-        nanosecond = (50 * fraw1_["clkcnt"][..., i_mirror] / 3 + fraw1_["jclkcnt"]).astype(int)
-    else:
-        raise IndexError(f"""Expected 0 <= i_mirror < {fraw1_["num_mir"]}, got {i_mirror}.""")
 
-    if nanosecond > 999999999:
-        nanosecond -= 1000000000
-        _total_seconds += 1
+def get_ns_at_mirror(fraw1_, i_mirror=0):
+    """Same as get_datetimes_at_mirror but in int64 nanoseconds since the Unix epoch."""
+    # fields one by one, so that dict banks (read_dst(return_as_numpy_array=False)) are accepted as well
+    julian = np.asarray(fraw1_["julian"]).astype(np.int64)
+    Y = julian // 10000
+    m = (julian // 100) % 100
+    d = julian % 100
+    days = (
+        ((Y - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (m - 1)).astype("datetime64[D]") + (d - 1)
+    ).astype(np.int64)
 
-    H = _total_seconds // 3600
-    M = (_total_seconds // 60) % 60
-    S = _total_seconds % 60
+    num_mir = np.asarray(fraw1_["num_mir"])
+    i_mirror = np.broadcast_to(i_mirror, num_mir.shape)
+    no_mirror = (i_mirror == 0) & (num_mir == 0)
+    valid = (0 <= i_mirror) & (i_mirror < num_mir)
+    if not np.all(no_mirror | valid):
+        raise IndexError(f"Expected 0 <= i_mirror < num_mir, got {i_mirror[~(no_mirror | valid)]}.")
 
-    return Y, m, d, H, M, S, nanosecond
+    indices = np.where(valid, i_mirror, 0)[..., np.newaxis]
+    second = np.take_along_axis(np.asarray(fraw1_["second"]), indices, axis=-1)[..., 0].astype(np.int64)
+    clkcnt = np.take_along_axis(np.asarray(fraw1_["clkcnt"]), indices, axis=-1)[..., 0].astype(np.int64)
 
+    total_seconds = np.asarray(fraw1_["jsecond"]).astype(np.int64) + np.where(valid, second, 0)
+    nanosecond = np.where(valid, 50 * clkcnt // 3 + np.asarray(fraw1_["jclkcnt"]), 0)
+    carry, nanosecond = np.divmod(nanosecond, 1000000000)
 
-def print(fraw1_):
-    header = "\n".join([
-        " evt_code {event_code:>4} run start: {Y}/{m}/{d} {H}:{M:02}:{S:02}.{nanosecond:09d}".format(
-            event_code=fraw1_["event_code"],
-            m=(fraw1_["julian"] // 100) % 100, d=fraw1_["julian"] % 100, Y=fraw1_["julian"] // 10000,
-            H=fraw1_["jsecond"] // 3600, M=(fraw1_["jsecond"] // 60) % 60, S=fraw1_["jsecond"] % 60,
-            nanosecond=fraw1_["jclkcnt"]
-        ),
-        " site  {site:>4} part  {part:>4} event_num  {event_num:>4} num_mir  {num_mir:>4}".format(
-            site=fraw1_["site"],
-            part=fraw1_["part"],
-            event_num=fraw1_["event_num"],
-            num_mir=fraw1_["num_mir"],
-        )
-    ])
+    return (days * 86400 + total_seconds + carry) * 1000000000 + nanosecond
 
-    indices_mirror = np.arange(fraw1_["num_mir"])
-    mirror_headers = [
-        f" m  {m:>4} num_chan  {num_chan:>4}"
-        for m, num_chan in zip(fraw1_["mir_num"][indices_mirror], fraw1_["num_chan"][indices_mirror])
-    ]
 
-    _, _, _, H, M, S, nanosecond = _get_sep_datetime_at_mirror(fraw1_, indices_mirror)
-    mirror_times = [
-        " event store start time -- {}:{:02}:{:02}.{:09d}".format(*args)
-        for args in zip(H, M, S, nanosecond)
-    ]
+_hex_cells = np.array([f" {i:02X}" for i in range(256)], dtype="S3")
 
-    signal_headers = [
-        [
-            f" hit {jp1:>3} chan(HI=00-FF, LO=100-11F, TR=200-21F)  {f'{chn_i_j:>02X}':>3} it0  {it0chn_i_j:>4} nt  {ntchn_i_j:>3}"
-            for jp1, chn_i_j, it0chn_i_j, ntchn_i_j in zip(np.arange(num_chan_i) + 1, channel_i, it0_chan_i, nt_chan_i)
-        ]
-        for num_chan_i, channel_i, it0_chan_i, nt_chan_i in zip(
-            fraw1_["num_chan"][indices_mirror], fraw1_["channel"][indices_mirror], fraw1_["it0_chan"][indices_mirror], fraw1_["nt_chan"][indices_mirror]
-        )
-    ]
 
-    m_fadc_values = [
-        [
-            [mfdc_i_j_k for mfdc_i_j_k, k in zip(m_fadc_i_j, np.arange(nt_chan_i_j))]
-            for m_fadc_i_j, nt_chan_i_j, _ in zip(m_fadc_i, nt_chan_i, np.arange(num_chan_i))
-        ]
-        for m_fadc_i, num_chan_i, nt_chan_i in zip(
-            fraw1_["m_fadc"][indices_mirror].view("i1"), fraw1_["num_chan"][indices_mirror], fraw1_["nt_chan"][indices_mirror]
+def _format_hex(values, n_per_line=20):
+    cells = _hex_cells[values]
+    return b"\n".join(cells[i:i + n_per_line].tobytes() for i in range(0, len(cells), n_per_line)).decode()
+
+
+def dump(fraw1_, file):
+    """Write `fraw1_` as text to the file object `file` (the same format as print)."""
+    julian = int(fraw1_["julian"])
+    jsecond = int(fraw1_["jsecond"])
+    num_mir = int(fraw1_["num_mir"])
+
+    lines = [
+        " evt_code {event_code:>4} run start: {Y}/{m}/{d} {H}:{M:02}:{S:02}.{nanosecond:09d}".format(
+            event_code=int(fraw1_["event_code"]),
+            m=(julian // 100) % 100, d=julian % 100, Y=julian // 10000,
+            H=jsecond // 3600, M=(jsecond // 60) % 60, S=jsecond % 60,
+            nanosecond=int(fraw1_["jclkcnt"])
+        ),
+        " site  {site:>4} part  {part:>4} event_num  {event_num:>4} num_mir  {num_mir:>4}".format(
+            site=int(fraw1_["site"]),
+            part=int(fraw1_["part"]),
+            event_num=int(fraw1_["event_num"]),
+            num_mir=num_mir,
         )
     ]
 
-    signals = [
-        [
-            "\n".join(
-                "".join(col for col in row)
-                for row in more_itertools.windowed((f" {e:02X}" for e in m_fadc_i_j), n=20, step=20)
+    # event store start time of all the mirrors at once
+    total_seconds = jsecond + fraw1_["second"][:num_mir].astype(np.int64)
+    nanosecond = 50 * fraw1_["clkcnt"][:num_mir].astype(np.int64) // 3 + int(fraw1_["jclkcnt"])
+    carry, nanosecond = np.divmod(nanosecond, 1000000000)
+    total_seconds += carry
+
+    m_fadc = fraw1_["m_fadc"].view("u1")
+    for i in range(num_mir):
+        num_chan = int(fraw1_["num_chan"][i])
+        lines.append(f" m  {int(fraw1_['mir_num'][i]):>4} num_chan  {num_chan:>4}")
+        lines.append(" event store start time -- {}:{:02}:{:02}.{:09d}".format(
+            total_seconds[i] // 3600, (total_seconds[i] // 60) % 60, total_seconds[i] % 60, nanosecond[i]
+        ))
+        for j, (channel, it0_chan, nt_chan) in enumerate(zip(
+                fraw1_["channel"][i][:num_chan].tolist(),
+                fraw1_["it0_chan"][i][:num_chan].tolist(),
+                fraw1_["nt_chan"][i][:num_chan].tolist()
+        )):
+            lines.append(
+                f" hit {j + 1:>3} chan(HI=00-FF, LO=100-11F, TR=200-21F)  {f'{channel:>02X}':>3}"
+                f" it0  {it0_chan:>4} nt  {nt_chan:>3}"
             )
-            for m_fadc_i_j in m_fadc_i
-        ]
-        for m_fadc_i in m_fadc_values
-    ]
+            lines.append(_format_hex(m_fadc[i][j][:nt_chan]))
 
-    builtins.print(header)
-    builtins.print(
-       "\n".join(
-           more_itertools.roundrobin(
-                mirror_headers,
-                mirror_times,
-                (
-                    "\n".join(more_itertools.roundrobin(signal_headers_i, signals_i))
-                    for signal_headers_i, signals_i in zip(signal_headers, signals)
-                )
-            )
-       )
-    )
+    lines.append("")
+    file.write("\n".join(lines))
+
+
+def print(fraw1_):
+    dump(fraw1_, sys.stdout)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import numpy as np
+
+
+__all__ = ["DSTCache", "default_cache_dir"]
+
+
+env_variable = "PYDST_CACHE_DIR"
+
+
+def default_cache_dir():
+    if env_variable in os.environ:
+        return pathlib.Path(os.environ[env_variable])
+    return pathlib.Path.home() / ".cache" / "pydst"
+
+
+class DSTCache:
+    """
+    On-disk cache of decoded DST files.
+
+    Each entry is a directory of .npy arrays, one per bank, keyed by the path, mtime and size of the DST file and
+    the requested banks and fields. Entries are loaded with mmap_mode='r', and the least recently used ones are
+    evicted when the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory: os.PathLike = None, max_bytes=10 * 1024 ** 3):
+        self.directory = pathlib.Path(default_cache_dir() if directory is None else directory)
+        self.max_bytes = max_bytes
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(directory='{self.directory}', max_bytes={self.max_bytes})"
+
+    def _get_entry(self, path, want_bank_names, fields=None):
+        path = pathlib.Path(path).resolve()
+        stat = path.stat()
+        key = json.dumps([
+            str(path), stat.st_mtime_ns, stat.st_size,
+            None if want_bank_names is None else sorted(want_bank_names),
+            None if not fields else sorted((bn, list(fs)) for bn, fs in fields.items())
+        ])
+        return self.directory / hashlib.sha1(key.encode()).hexdigest()
+
+    def load(self, path: os.PathLike, want_bank_names=None, fields=None):
+        """Return a dict of bank name -> memory-mapped array, or None if `path` is not cached."""
+        entry = self._get_entry(path, want_bank_names, fields)
+        meta_path = entry / "meta.json"
+        if not meta_path.exists():
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        os.utime(entry)  # mark as recently used
+        return {bn: np.load(entry / f"{bn}.npy", mmap_mode="r") for bn in meta["banks"]}
+
+    def store(self, path: os.PathLike, want_bank_names, arrays: dict, fields=None):
+        """Store a dict of bank name -> array for `path`, and evict old entries if needed."""
+        entry = self._get_entry(path, want_bank_names, fields)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Write into a temporary directory first so that readers never see an incomplete entry.
+        tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=self.directory, prefix=".tmp-"))
+        try:
+            for bn, array in arrays.items():
+                np.save(tmp_dir / f"{bn}.npy", array)
+            with open(tmp_dir / "meta.json", "w") as f:
+                json.dump({"path": str(pathlib.Path(path).resolve()), "banks": list(arrays)}, f)
+            if entry.exists():
+                shutil.rmtree(entry)
+            tmp_dir.rename(entry)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.evict(keep=entry)
+
+    def evict(self, keep: os.PathLike = None):
+        """Remove the least recently used entries until the total size is below `max_bytes`."""
+        if not self.directory.exists():
+            return
+
+        entries = [
+            (e.stat().st_mtime, sum(f.stat().st_size for f in e.iterdir()), e)
+            for e in self._iter_entries()
+        ]
+        total = sum(size for _, size, _ in entries)
+        for _, size, e in sorted(entries, key=lambda x: x[0]):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and e == pathlib.Path(keep):
+                continue
+            shutil.rmtree(e, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        if self.directory.exists():
+            for e in self._iter_entries():
+                shutil.rmtree(e, ignore_errors=True)
+
+    def _iter_entries(self):
+        return (e for e in self.directory.iterdir() if e.is_dir() and (e / "meta.json").exists())
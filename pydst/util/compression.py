@@ -0,0 +1,102 @@
+import builtins
+import bz2
+import gzip
+import lzma
+import os
+import pathlib
+import shutil
+import threading
+
+
+__all__ = ["openers", "native_compressions", "get_compression", "PipeStream"]
+
+
+openers = {
+    "gz": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+
+# read and written by dst2k itself, which is linked with zlib and libbz2
+native_compressions = {"gz", "bz2"}
+
+_suffixes = {
+    ".gz": "gz",
+    ".bz2": "bz2",
+    ".xz": "xz",
+}
+
+
+def get_compression(path: os.PathLike):
+    return _suffixes.get(pathlib.Path(path).suffix)
+
+
+class PipeStream:
+    """
+    Decompress (mode 'r') or compress (mode 'w' or 'a') a file on the fly through an anonymous pipe.
+
+    The (de)compression runs in a background thread, and the other end of the pipe is exposed as `fifo_path`,
+    which can be opened by the C library like a plain file. No temporary file is created.
+    Call `release()` once the C library has opened `fifo_path`, and `close()` after it has closed it.
+    """
+
+    def __init__(self, path: os.PathLike, mode: str, compression: str):
+        if compression not in openers:
+            raise ValueError(f"unsupported compression: '{compression}'")
+
+        self.path = pathlib.Path(path)
+        self.mode = mode
+        self._opener = openers[compression]
+        self._error = None
+
+        read_fd, write_fd = os.pipe()
+        if mode == "r":
+            self._fd, self._c_fd = write_fd, read_fd
+            target = self._decompress
+        else:
+            self._fd, self._c_fd = read_fd, write_fd
+            target = self._compress
+
+        self.fifo_path = f"/dev/fd/{self._c_fd}"
+        self._thread = threading.Thread(target=target, name=f"{self.__class__.__name__}({self.path.name})", daemon=True)
+        self._thread.start()
+
+    def _decompress(self):
+        f_out = builtins.open(self._fd, "wb")
+        try:
+            with self._opener(self.path, "rb") as f_in:
+                shutil.copyfileobj(f_in, f_out)
+        except BrokenPipeError:
+            pass  # closed before reaching the end of the file
+        except BaseException as e:
+            self._error = e
+        finally:
+            # Close the pipe only after the error is set, so that the reader never takes a failure for EOF.
+            try:
+                f_out.close()
+            except BrokenPipeError:
+                pass
+
+    def _compress(self):
+        try:
+            with builtins.open(self._fd, "rb") as f_in, self._opener(self.path, f"{self.mode}b") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        except BaseException as e:
+            self._error = e
+
+    def release(self):
+        """Close this process's copy of the C-side end of the pipe, so that EOF can be propagated."""
+        if self._c_fd is not None:
+            os.close(self._c_fd)
+            self._c_fd = None
+
+    def check(self):
+        """Raise the exception occurred in the background thread, if any (only once)."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        self.release()
+        self._thread.join()
+        self.check()
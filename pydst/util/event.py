@@ -1,21 +1,40 @@
+import collections
+import concurrent.futures
+import glob
 import io
+import itertools
+import multiprocessing
 import os
 import pathlib
-import gzip
-import shutil
+import queue
 import sys
+import threading
+import time
 import warnings
+import weakref
 
 import numpy as np
-from .. import _dst_cffi as dst
+from .. import _dst as dst
 from .. import c_to_py
 from . import bank_list
-import builtins
-import tqdm
-import numpy_utility as npu
+from . import banks
+from .cache import DSTCache
+from .compression import PipeStream, get_compression, native_compressions
+from .stats import IOStats
+from . import units
+from . import views
 
 
-def open(file, mode="r"):
+def _import_tqdm():
+    # tqdm is optional, and imported only when a progress bar is shown
+    try:
+        import tqdm
+    except ImportError:
+        return None
+    return tqdm
+
+
+def open(file, mode="r", compression="infer", cache=None, stats=None):
     """
     The available modes are:
     ========= ===============================================================
@@ -25,13 +44,125 @@ def open(file, mode="r"):
     'w'       open for writing, truncating the file first
     'a'       open for writing, appending to the end of the file if it exists
     ========= ===============================================================
+
+    `compression` is one of 'gz', 'bz2', 'xz' or None. Compressed files are (de)compressed on the fly through a
+    pipe, and None passes the path to dst2k as it is. If 'infer' (default), '.xz' files are piped, and the others,
+    including '.gz' and '.bz2' files which dst2k (de)compresses by itself, are passed as they are.
+
+    `cache` is a cache.DSTCache, a cache directory, or True to use the default one. If given, read_banks() stores
+    the decoded banks there on the first read and memory-maps them on later reads.
+
+    `stats` is a stats.IOStats, True to create one, or a function hook(stage, seconds) to create one with.
+    If given, the time spent in each stage and the numbers of events and banks are recorded to the `stats`
+    attribute of the returned object. Nothing is measured by default.
     """
 
     path = pathlib.Path(file)
     if mode not in DSTIOWrapper.mode_table:
         raise ValueError(f"invalid mode: '{mode}'")
 
-    return DSTIOWrapper(path, mode)
+    return DSTIOWrapper(path, mode, compression, cache, stats)
+
+
+def read_many(files, want_bank_names=None, batch_size=None, max_workers=None, depth=2):
+    """
+    Read many DST files in parallel over `max_workers` processes.
+
+    `files` is a list of paths or a glob pattern (sorted by name).
+    If `batch_size` is None, all the events are returned as one structured array in the order of `files`, and each
+    worker sends the events of a whole file at once.
+    Otherwise, an iterator over batches of at most `batch_size` events is returned in the same order. Each file is
+    then streamed by its own process, up to `max_workers` files at a time and `depth` batches ahead each, so that
+    the memory use is bounded by the batch size, not by the file sizes.
+    Every file must contain the banks of `want_bank_names` (or the same banks if it is None).
+    """
+    if isinstance(files, (str, os.PathLike)):
+        files = sorted(glob.glob(str(files)))
+    files = [pathlib.Path(f) for f in files]
+
+    if batch_size is None:
+        arrays = list(_map_files(files, want_bank_names, max_workers))
+        if len(arrays) == 0:
+            return np.empty(0, dtype=_get_event_dtype(want_bank_names or ()))
+        return np.concatenate(arrays)
+    else:
+        return _stream_files(files, want_bank_names, batch_size, max_workers, depth)
+
+
+def _map_files(files, want_bank_names, max_workers):
+    # Keep at most one file per worker in flight so that finished results do not pile up in memory.
+    max_in_flight = max_workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        futures = collections.deque()
+        for path in files:
+            if len(futures) >= max_in_flight:
+                yield futures.popleft().result()
+            futures.append(executor.submit(_read_file, path, want_bank_names))
+        while len(futures) > 0:
+            yield futures.popleft().result()
+
+
+def _read_file(path, want_bank_names):
+    """Return all the events of the file as one array."""
+    with open(path) as f:
+        batches = [batch.copy() for batch in f.read_batches(10000, want_bank_names)]
+    if len(batches) == 0:
+        return np.empty(0, dtype=_get_event_dtype(want_bank_names or ()))
+    return np.concatenate(batches)
+
+
+def _stream_files(files, want_bank_names, batch_size, max_workers, depth):
+    """Yield the batches of the files in order, each file read by a process putting its batches into a queue."""
+    max_workers = max_workers or os.cpu_count() or 1
+    files = iter(files)
+    readers = collections.deque()  # (process, queue) in the order of the files
+
+    def start(path):
+        q = multiprocessing.Queue(depth)
+        p = multiprocessing.Process(target=_stream_file, args=(path, want_bank_names, batch_size, q), daemon=True)
+        p.start()
+        readers.append((p, q))
+
+    try:
+        for path in itertools.islice(files, max_workers):
+            start(path)
+
+        while len(readers) > 0:
+            p, q = readers[0]
+            while True:
+                try:
+                    kind, value = q.get(timeout=0.1)
+                except queue.Empty:
+                    if p.is_alive() or not q.empty():
+                        continue
+                    raise RuntimeError(f"the process reading a DST file exited with code {p.exitcode}")
+
+                if kind == _ITEM:
+                    yield value
+                elif kind == _ERROR:
+                    raise value
+                else:
+                    break
+
+            p.join()
+            readers.popleft()
+            for path in itertools.islice(files, 1):
+                start(path)
+    finally:
+        for p, _ in readers:
+            p.terminate()
+            p.join()
+
+
+def _stream_file(path, want_bank_names, batch_size, q):
+    try:
+        with open(path) as f:
+            for batch in f.read_batches(batch_size, want_bank_names):
+                q.put((_ITEM, batch.copy()))  # copied since the batch is pickled later, by the feeder thread
+    except BaseException as e:
+        q.put((_ERROR, e))
+    else:
+        q.put((_DONE, None))
 
 
 # from contextlib import contextmanager
@@ -74,15 +205,140 @@ def _get_global_variable(bank_name):
         raise NotImplementedError
 
 
+_built_banks = {}
+
+
+def _drop_unbuilt_banks(bank_names):
+    """
+    Return `bank_names` without the banks having no global variable in this build (not in PYDST_BANKS, or whose
+    headers cannot be built), which dst2k reads when all the banks are wanted. A warning is issued once per bank.
+    """
+    built = [_is_built(bn) for bn in bank_names]
+    return bank_names if all(built) else bank_names[built]
+
+
+def _is_built(bank_name):
+    if bank_name not in _built_banks:
+        try:
+            _get_global_variable(bank_name)
+            _built_banks[bank_name] = True
+        except NotImplementedError:
+            _built_banks[bank_name] = False
+            warnings.warn(f"Bank '{bank_name}' is skipped since it is not built in pydst.", RuntimeWarning)
+    return _built_banks[bank_name]
+
+
+def _set_global_variable(bank_name, value):
+    address, c_dtype, fields = _get_write_plan(bank_name, getattr(value, "dtype", None))
+    if fields is None:
+        row = value
+    else:
+        row = np.zeros((), dtype=c_dtype)
+        for k in (value.keys() if isinstance(value, dict) else fields):
+            row[k] = value[k]
+    dst.ffi.memmove(address, np.ascontiguousarray(row).view(np.uint8), c_dtype.itemsize)
+
+
+_write_plans = {}
+
+
+def _get_write_plan(bank_name, dtype):
+    """
+    Return (address of the global variable of the bank, its dtype, names of the fields to be copied one by one).
+    The field names are None if `dtype` has the same layout as the global variable, which can be copied at once.
+    """
+    key = (bank_name, dtype)
+    if key not in _write_plans:
+        var = _get_global_variable(bank_name)
+        c_dtype = c_to_py.get_dtype(var)
+        if dtype == c_dtype:
+            fields = None
+        elif dtype is None or dtype.names is None:
+            fields = []
+        else:
+            fields = [name for name in dtype.names if name in c_dtype.names]
+        _write_plans[key] = dst.ffi.addressof(var), c_dtype, fields
+    return _write_plans[key]
+
+
+def _compile_where(where):
+    """
+    Return a function taking a views.BorrowedEvent from `where`, a function or an expression on bank fields.
+    An expression referring to a bank missing in an event does not select the event.
+    """
+    if where is None or callable(where):
+        return where
+
+    code = compile(where, "<where>", "eval")
+
+    def _predicate(event):
+        try:
+            return bool(eval(code, {"__builtins__": {}, "np": np}, {bn: event[bn] for bn in event}))
+        except NameError as e:
+            if e.name in _get_bank_table()[1]:
+                return False
+            raise  # not a bank name, e.g. a typo
+
+    return _predicate
+
+
+_event_dtypes = {}
+
+
+def _get_event_dtype(bank_names, fields=None):
+    """Return the dtype of an event with `bank_names`, whose banks in `fields` are projected to those fields."""
+    fields = fields or {}
+    key = (tuple(bank_names), tuple((bn, tuple(fs)) for bn, fs in fields.items()))
+    if key not in _event_dtypes:
+        _event_dtypes[key] = np.dtype([
+            (
+                bn,
+                c_to_py.get_dtype(_get_global_variable(bn)) if bn not in fields else
+                c_to_py.get_projected_dtype(_get_global_variable(bn), fields[bn])[1]
+            )
+            for bn in bank_names
+        ])
+    return _event_dtypes[key]
+
+
+def _has_current_layout(arrays, fields=None):
+    """Return whether the arrays of a dict of bank name -> array have the dtypes of the banks of this build."""
+    try:
+        return all(array.dtype == _get_event_dtype((bn,), fields)[bn] for bn, array in arrays.items())
+    except NotImplementedError:
+        return False
+
+
+# kinds of the items put into the queues by the prefetching worker and the processes of read_many
+_ITEM, _WARNING, _ERROR, _DONE = range(4)
+
+# returned by the functions consuming events in DSTIOWrapper._read_events for events not to be yielded
+_SKIP = object()
+
+# The bank global variables of dst2k are shared by all the wrappers and threads (e.g. prefetching workers), and
+# every section filling them (eventRead, or copies for eventWrite) and using the contents holds this lock.
+_globals_lock = threading.RLock()
+
+
+def _finalize_unit(unit_pool, in_unit, stream):
+    # called when a DSTIOWrapper is garbage-collected or at exit without being closed
+    try:
+        dst.lib.dstCloseUnit(in_unit)
+        if stream is not None:
+            stream.close()  # waits for the compression thread, which would be killed at exit before finishing
+    finally:
+        unit_pool.release(in_unit)
+
+
 class DSTIOWrapper:
-    used_unit_numbers = {0}
+    unit_pool = units.pool
     mode_table = {
         "r": 1,
         "w": 2,
         "a": 3
     }
 
-    def __init__(self, path: os.PathLike, mode: str):
+    def __init__(self, path: os.PathLike, mode: str, compression="infer", cache=None, stats=None):
         path = pathlib.Path(path)
 
         if mode not in DSTIOWrapper.mode_table:
@@ -91,34 +347,44 @@ class DSTIOWrapper:
         if mode == "r" and not path.exists():
             raise FileNotFoundError(f"[Errno 2] No such file: '{path}'")
 
-        self.in_unit = max(DSTIOWrapper.used_unit_numbers) + 1
+        if compression == "infer":
+            compression = get_compression(path)
+            if compression in native_compressions:
+                compression = None
+
         self.path = path
         self.mode = mode
+        self.compression = compression
         self.closed = False
-        # self.is_gz_file = path.suffix == ".gz"
-        self.is_gz_file = False
-
-        in_mode = DSTIOWrapper.mode_table[mode]
 
-        if self.is_gz_file:
-            if mode in ("w", "a"):
-                self._uncompressed_path = path.with_suffix("")
-                builtins.open(path, f"{mode}b").close()
-            else:
-                self._uncompressed_path = pathlib.Path("/tmp") / path.with_suffix("").name
-
-            if mode in ("r", "a"):
-                if not self._uncompressed_path.exists():
-                    with gzip.open(path, "rb") as f_uncompressed:
-                        with builtins.open(self._uncompressed_path, "wb") as f:
-                            shutil.copyfileobj(f_uncompressed, f)
+        if cache is None or cache is False or isinstance(cache, DSTCache):
+            self.cache = cache or None
+        elif cache is True:
+            self.cache = DSTCache()
+        else:
+            self.cache = DSTCache(cache)
 
-            path = self._uncompressed_path
+        if stats is None or stats is False or isinstance(stats, IOStats):
+            self.stats = stats or None
+        elif stats is True:
+            self.stats = IOStats()
+        else:
+            self.stats = IOStats(hook=stats)
 
-        dst.lib.dstOpenUnit(self.in_unit, str(path).encode('ascii'), in_mode)
-        DSTIOWrapper.used_unit_numbers.add(self.in_unit)
+        self.in_unit = self.unit_pool.acquire()
+        try:
+            self._open_unit()
+        except BaseException:
+            self.unit_pool.release(self.in_unit)
+            raise
 
         self.event = dst.ffi.new('int32_t *')
+        self._borrowed_views = {}
+        self._position = 0  # index of the next event to be read
+        self._index = None  # dict of bank name -> array of all the events, by build_index
+        self._n_events = None
+        self._prefetcher = None  # (worker thread, stop event) while prefetching
+        self._warn = warnings.warn  # replaced by the prefetching worker to forward warnings to the consumer
 
     def __str__(self):
         return f"<{self.__class__.__name__} name='{self.path}' mode='{self.mode}' in_unit={self.in_unit}>"
@@ -126,98 +392,516 @@ class DSTIOWrapper:
     def __repr__(self):
         return self.__str__()
 
-    def __del__(self):
-        dst.ffi.release(self.event)
-        if not self.closed:
-            self.close()
-
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
-    def close(self):
+    def _open_unit(self):
+        path = self.path
+        if self.compression is None:
+            self._stream = None
+        else:
+            self._stream = PipeStream(path, self.mode, self.compression)
+            path = self._stream.fifo_path
+
+        rc = dst.lib.dstOpenUnit(self.in_unit, str(path).encode('ascii'), DSTIOWrapper.mode_table[self.mode])
+
+        if self._stream is not None:
+            self._stream.release()
+
+        if rc < 0:
+            if self._stream is not None:
+                self._stream.close()
+            raise RuntimeError(f"""
+    Error code = {rc} while opening dst '{self.path}' on unit {self.in_unit}.
+    It might be useful to check 'dst2k-ta/inc/dst_err_codes.h'.
+            """)
+
+        # The unit is closed and released even if the wrapper is not closed, with the stream of the current opening.
+        self._finalizer = weakref.finalize(self, _finalize_unit, self.unit_pool, self.in_unit, self._stream)
+
+    def _close_unit(self):
+        self._finalizer.detach()
         dst.lib.dstCloseUnit(self.in_unit)
-        DSTIOWrapper.used_unit_numbers.remove(self.in_unit)
-        self.closed = True
 
-        if self.is_gz_file:
-            if self.mode in ("w", "a"):
-                with gzip.open(self.path, f"{self.mode}b") as f_compressed:
-                    with builtins.open(self._uncompressed_path, "rb") as f:
-                        shutil.copyfileobj(f, f_compressed)
+        if self._stream is not None:
+            self._stream.close()
 
-            if self._uncompressed_path.exists():
-                self._uncompressed_path.unlink()
+    def close(self):
+        if self.closed:
+            return
 
-    def read_dst(self, want_bank_names=None, return_as_numpy_array=True):
+        if self._prefetcher is not None:
+            worker, stop = self._prefetcher
+            stop.set()
+            worker.join()
+
+        try:
+            self._close_unit()
+        finally:
+            self.unit_pool.release(self.in_unit)
+            self.closed = True
+            views.invalidate()
+
+    def seek_event(self, i):
+        """
+        Move the reading position so that the next event read is the `i`-th one (0-based).
+
+        dst2k cannot seek by bytes, so the file is reopened when moving backward, and the events in between are
+        skipped without unpacking any bank.
+        """
         if self.mode != "r":
             raise io.UnsupportedOperation("not readable")
+        if i < 0:
+            raise ValueError(f"Expected i >= 0, got {i}.")
+
+        if i < self._position:
+            self._close_unit()
+            self._open_unit()
+            self._position = 0
+            views.invalidate()
+
+        if i > self._position:
+            with bank_list.borrow(150) as want_bank, bank_list.borrow(150) as got_bank:
+                while self._position < i:
+                    with _globals_lock:
+                        if not self._read_event(want_bank, got_bank):
+                            break
+
+    def tell_event(self):
+        """Return the index of the next event to be read."""
+        return self._position
+
+    def build_index(self, want_bank_names=None, fields=None):
+        """
+        Decode `want_bank_names` (the banks of the first event if None) of all the events once, projected to
+        `fields` as in read_dst, so that indexing the wrapper is served from the decoded banks afterwards.
+
+        All the decoded banks are held in memory, or memory-mapped from the cache of the wrapper if it has one, so
+        project large banks with `fields`. The reading position is left unchanged.
+        """
+        self._index = self.read_banks(want_bank_names, fields=fields)
+        return self._index
+
+    def __bool__(self):
+        # always true like other file objects, instead of falling back to __len__, which skips through the file
+        return True
+
+    def __len__(self):
+        """Return the number of events, counted once by skipping all the events without unpacking any bank."""
+        if self._index is not None:
+            return len(next(iter(self._index.values()), ()))
+
+        if self._n_events is None:
+            position = self._position
+            self.seek_event(sys.maxsize)
+            self._n_events = self._position
+            self.seek_event(position)
+        return self._n_events
+
+    def __getitem__(self, key):
+        """
+        Return the event(s) at `key` (an index, a slice or an array of indices) by random access.
+
+        Without an index (see build_index), the events are read one by one after seek_event, so that only the
+        events asked for are decoded, and the reading position is left after the last of them. Several events are
+        returned as a structured array with the banks of the first of them, as in read_batches.
+        Negative indices, open-ended slices and boolean masks need len(), which skips through the whole file once.
+        """
+        if self._index is not None:
+            return self._get_from_index(key)
 
-        want_bank = bank_list.BankList(150)
-        if want_bank_names is None:
-            want_bank.set_all_banks()
+        if isinstance(key, (int, np.integer)):
+            event = self._read_event_at(key + len(self) if key < 0 else key)
+            if event is None:
+                raise IndexError("event index out of range")
+            return event
+
+        truncate = False
+        if isinstance(key, slice):
+            start, stop, step = key.start or 0, key.stop, key.step or 1
+            if stop is not None and start >= 0 and stop >= 0 and step > 0:
+                indices = np.arange(start, stop, step)
+                truncate = True  # stopped at the end of the file, as slices of sequences are
+            else:
+                indices = np.arange(len(self))[key]
         else:
-            want_bank.extend(get_id_from_name(want_bank_names))
-        got_bank = bank_list.BankList(150)
+            indices = np.asarray(key)
+            if indices.dtype == bool or (indices < 0).any():
+                indices = np.arange(len(self))[indices]
 
-        # null_fds = [os.open(os.devnull, os.O_RDWR) for _ in range(2)]
-        # # save the current file descriptors to a tuple
-        # save = os.dup(1), os.dup(2)
+        rows = None
+        # in the order of the file, so that seek_event does not reopen the file for every event
+        for j in np.argsort(indices, kind="stable"):
+            event = self._read_event_at(indices[j])
+            if event is None:
+                if truncate:
+                    return np.empty(0, dtype=_get_event_dtype(())) if rows is None else rows[:j]
+                raise IndexError(f"event index {indices[j]} out of range")
 
-        while True:
-            # # put /dev/null fds on 1 and 2
-            # os.dup2(null_fds[0], 1)
-            # os.dup2(null_fds[1], 2)
+            if rows is None:
+                rows = np.zeros(len(indices), dtype=event.dtype)
+            for bn in event.dtype.names:
+                if bn in rows.dtype.names:
+                    rows[bn][j] = event[bn]
 
-            rc = dst.lib.eventRead(self.in_unit, want_bank._bank_id, got_bank._bank_id, self.event)
+        return np.empty(0, dtype=_get_event_dtype(())) if rows is None else rows
 
-            # # restore file descriptors so I can print the results
-            # os.dup2(save[0], 1)
-            # os.dup2(save[1], 2)
+    def _read_event_at(self, i):
+        """Read the `i`-th event after seek_event, or return None if there is no such event."""
+        self.seek_event(i)
+        events = self.read_dst()
+        try:
+            return next(events, None)
+        finally:
+            events.close()
 
-            if self.event[0] == 0:
-                break
+    def _get_from_index(self, key):
+        dtype = np.dtype([(bn, array.dtype) for bn, array in self._index.items()])
+        if isinstance(key, (int, np.integer)):
+            row = np.empty(1, dtype=dtype)
+            for bn, array in self._index.items():
+                row[bn][0] = array[key]
+            return row[0]
 
-            if rc <= 0:
-                if rc == -1:
-                    warnings.warn(  # This bank has not finished properly in the writing process.
-                        "STOP_BANK not found.", RuntimeWarning
-                    )
-                    break
-                else:
-                    raise RuntimeError(f"""
+        rows = None
+        for bn, array in self._index.items():
+            selected = array[key]
+            if rows is None:
+                rows = np.empty(len(selected), dtype=dtype)
+            rows[bn] = selected
+        return rows
+
+    def _read_events(self, want_bank_names, consume):
+        """
+        Read events one by one, and yield consume(names of the banks got) for each event unless it returns _SKIP.
+
+        `consume` is called while the event is in the bank global variables of dst2k, under _globals_lock so that
+        no other thread overwrites them in the meantime. The lock is released before yielding.
+        """
+        with bank_list.borrow(150) as want_bank, bank_list.borrow(150) as got_bank:
+            if want_bank_names is None:
+                want_bank.set_all_banks()
+            else:
+                want_bank.extend(get_id_from_name(want_bank_names))
+
+            stats = self.stats
+            while True:
+                with _globals_lock:
+                    if not self._read_event(want_bank, got_bank):
+                        return
+
+                    if stats is not None:
+                        t = time.perf_counter()
+                    bank_names = get_name_from_id(got_bank.to_numpy())
+                    if want_bank_names is None:
+                        bank_names = _drop_unbuilt_banks(bank_names)
+                    if stats is not None:
+                        stats.lap("lookup", t)
+
+                    value = consume(bank_names)
+
+                if value is not _SKIP:
+                    yield value
+
+    def _read_event(self, want_bank, got_bank):
+        """
+        Read the next event into the bank global variables of dst2k, and return False at the end of the file.
+        Call it holding _globals_lock.
+        """
+        if self._prefetcher is not None and threading.current_thread() is not self._prefetcher[0]:
+            raise RuntimeError("the events are being read by a prefetching worker")
+
+        stats = self.stats
+        if stats is not None:
+            t = time.perf_counter()
+        rc = dst.lib.eventRead(self.in_unit, want_bank._bank_id, got_bank._bank_id, self.event)
+        views.invalidate()
+        if stats is not None:
+            stats.lap("read", t)
+
+        if self._is_end(rc):
+            return False
+
+        self._position += 1
+        if stats is not None:
+            stats.events += 1
+        return True
+
+    def _is_end(self, rc):
+        """Return whether eventRead returning `rc` has reached the end of the file, and raise on errors."""
+        if self.event[0] == 0:
+            if self._stream is not None:
+                # Wait for the decompression to finish, so that a corrupt file is not taken for the end of it.
+                self._stream.close()
+            return True
+
+        if rc <= 0:
+            if rc == -1:
+                self._warn(  # This bank has not finished properly in the writing process.
+                    "STOP_BANK not found.", RuntimeWarning
+                )
+                return True
+            else:
+                raise RuntimeError(f"""
     Error code = {rc} while reading dst '{self.path}'.
     It might be useful to check 'dst2k-ta/inc/dst_err_codes.h'.
-                    """)
+                """)
+        return False
+
+    def read_dst(
+            self, want_bank_names=None, return_as_numpy_array=True, borrow=False, where=None, fields=None, lazy=False,
+            prefetch=0
+    ):
+        """
+        Read events one by one.
+
+        If `borrow` is True, views.BorrowedEvent objects giving read-only views of the bank global variables are
+        yielded instead of copies. They are valid only until the next event is read.
+        If `lazy` is True, views.LazyEvent objects are yielded, which copy each field on first access.
+
+        `where` selects events before converting them. It is either a function taking a views.BorrowedEvent and
+        returning a bool, or an expression on bank fields such as "fraw1.event_code == 1 and fraw1.site == 0".
+        Only the fields it refers to are read, directly from the bank global variables. Events lacking a bank the
+        expression refers to are not selected.
+
+        `fields` is a dict of bank name -> list of field names, e.g. {"fraw1": ["julian", "jsecond"]}. Only these
+        fields of the banks in it are copied, into a narrower dtype. It does not apply to borrowed or lazy events.
+
+        If `prefetch` > 0, a worker thread reads and converts events up to `prefetch` events ahead of the consumer,
+        so that the I/O of dst2k overlaps with the work on the events. It cannot be used with `borrow` or `lazy`.
+        Other wrappers can be used in the meantime (e.g. to write the events), since the bank global variables are
+        filled and used under a lock, except for borrowed and lazy events, which the worker makes stale.
+        """
+        if self.mode != "r":
+            raise io.UnsupportedOperation("not readable")
+
+        if prefetch > 0:
+            if borrow or lazy:
+                raise ValueError("prefetch cannot be used with borrow or lazy")
+            events = self.read_dst(want_bank_names, return_as_numpy_array, where=where, fields=fields)
+            yield from self._prefetch(events, prefetch)
+            return
 
-            bank_names = get_name_from_id(list(got_bank))
+        where = _compile_where(where)
+        fields = fields or {}
+        stats = self.stats
 
-            row = {bn: c_to_py.convert(_get_global_variable(bn)) for bn in bank_names}
+        def consume(bank_names):
+            if where is not None and not self._select(where, bank_names):
+                return _SKIP
+
+            if borrow:
+                return self._borrow(bank_names)
+            elif lazy:
+                return views.LazyEvent(self, {bn: self._get_borrowed_view(bn) for bn in bank_names})
+
+            if stats is not None:
+                t = time.perf_counter()
 
             if return_as_numpy_array:
-                yield npu.from_dict(row)[0]
+                row = np.empty(1, dtype=_get_event_dtype(bank_names, fields))
+                for bn in bank_names:
+                    row[bn][0] = c_to_py.view(_get_global_variable(bn), fields.get(bn))
+                event = row[0]
             else:
-                yield row
-
-        # # # close the temporary fds
-        # # os.close(null_fds[0])
-        # # os.close(null_fds[1])
-        #
-        # if return_as_numpy_array:
-        #     return np.concatenate(ret)
-        # else:
-        #     return ret
-
-    def write_dst(self, event_list: list, show_progress=True):
+                event = {bn: c_to_py.convert(_get_global_variable(bn), fields.get(bn)) for bn in bank_names}
+
+            if stats is not None:
+                stats.lap("convert", t)
+                stats.add_banks(bank_names, _get_event_dtype(bank_names, fields).itemsize)
+            return event
+
+        yield from self._read_events(want_bank_names, consume)
+
+    def _prefetch(self, items, depth):
+        """Iterate `items`, a generator reading this wrapper, in a worker thread and yield them in order."""
+        if self._prefetcher is not None:
+            raise RuntimeError("the events are being read by a prefetching worker")
+
+        q = queue.Queue(depth)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def work():
+            self._warn = lambda message, category: put((_WARNING, (message, category)))
+            try:
+                for item in items:
+                    if not put((_ITEM, item)):
+                        break
+            except BaseException as e:
+                put((_ERROR, e))
+            else:
+                put((_DONE, None))
+            finally:
+                items.close()
+                self._warn = warnings.warn
+
+        worker = threading.Thread(target=work, name=f"pydst-prefetch-{self.in_unit}", daemon=True)
+        self._prefetcher = worker, stop
+        worker.start()
+        try:
+            while True:
+                try:
+                    kind, value = q.get(timeout=0.1)
+                except queue.Empty:
+                    if worker.is_alive() or not q.empty():
+                        continue
+                    break  # stopped by close()
+
+                if kind == _ITEM:
+                    yield value
+                elif kind == _WARNING:
+                    warnings.warn(*value, stacklevel=2)
+                elif kind == _ERROR:
+                    raise value
+                else:
+                    break
+        finally:
+            stop.set()
+            worker.join()
+            self._prefetcher = None
+
+    def _select(self, where, bank_names):
+        if self.stats is None:
+            return where(self._borrow(bank_names))
+        t = time.perf_counter()
+        selected = where(self._borrow(bank_names))
+        self.stats.lap("where", t)
+        return selected
+
+    def _borrow(self, bank_names):
+        return views.BorrowedEvent(self, {bn: self._get_borrowed_view(bn) for bn in bank_names})
+
+    def _get_borrowed_view(self, bank_name):
+        # The global variables never move, so one view per bank serves every event.
+        if bank_name not in self._borrowed_views:
+            v = c_to_py.view(_get_global_variable(bank_name))
+            v.flags.writeable = False
+            self._borrowed_views[bank_name] = v
+        return self._borrowed_views[bank_name]
+
+    def read_batches(self, n, want_bank_names=None, where=None, fields=None, prefetch=0):
+        """
+        Read events into a preallocated structured array of `n` rows (one row per event) and yield it when full.
+
+        The same array is reused for every batch, so copy it if it has to outlive the next iteration.
+        The last batch is truncated to the number of remaining events.
+        The fields of the array are the banks in `want_bank_names`, or the banks of the first event if it is None.
+        Rows of events lacking some of these banks are zero-filled there, and other banks are ignored.
+        `where` selects events and `fields` projects banks as in read_dst.
+
+        If `prefetch` > 0, a worker thread reads up to `prefetch` batches ahead as in read_dst. The batches are
+        then new arrays, not reused.
+        """
+        if self.mode != "r":
+            raise io.UnsupportedOperation("not readable")
+        if n < 1:
+            raise ValueError(f"Expected n >= 1, got {n}.")
+
+        if prefetch > 0:
+            batches = (batch.copy() for batch in self.read_batches(n, want_bank_names, where, fields))
+            yield from self._prefetch(batches, prefetch)
+            return
+
+        where = _compile_where(where)
+        fields = fields or {}
+        stats = self.stats
+
+        batch = None
+        i = 0
+
+        def consume(bank_names):
+            nonlocal batch, i
+            if where is not None and not self._select(where, bank_names):
+                return _SKIP
+
+            if batch is None:
+                batch = np.zeros(n, dtype=_get_event_dtype(
+                    bank_names if want_bank_names is None else want_bank_names, fields
+                ))
+
+            if stats is not None:
+                t = time.perf_counter()
+            for bn in bank_names:
+                if bn in batch.dtype.names:
+                    batch[bn][i] = c_to_py.view(_get_global_variable(bn), fields.get(bn))
+            if stats is not None:
+                stats.lap("convert", t)
+                copied = [bn for bn in bank_names if bn in batch.dtype.names]
+                stats.add_banks(copied, sum(batch.dtype[bn].itemsize for bn in copied))
+            i += 1
+            return batch if i == n else _SKIP
+
+        for full_batch in self._read_events(want_bank_names, consume):
+            yield full_batch
+            batch[...] = 0
+            i = 0
+
+        if i > 0:
+            yield batch[:i]
+
+    def read_banks(self, want_bank_names=None, batch_size=10000, fields=None):
+        """
+        Read all the events of the file, and return a dict of bank name -> structured array (one row per event).
+
+        The banks are those in `want_bank_names`, or the banks of the first event if it is None, and those in
+        `fields` are projected to these fields as in read_dst.
+        The file is read from the start whatever the reading position is, and the position is left unchanged.
+        If the wrapper has a cache, the arrays are memory-mapped from it, and stored there on a cache miss.
+        Cached arrays whose dtypes differ from those of this build (e.g. built against another dst2k) are ignored.
+        """
+        if self.mode != "r":
+            raise io.UnsupportedOperation("not readable")
+
+        if self.cache is not None:
+            arrays = self.cache.load(self.path, want_bank_names, fields)
+            if arrays is not None and _has_current_layout(arrays, fields):
+                return arrays
+
+        position = self._position
+        self.seek_event(0)
+        batches = [batch.copy() for batch in self.read_batches(batch_size, want_bank_names, fields=fields)]
+        self.seek_event(position)
+
+        if len(batches) == 0:
+            dtype = _get_event_dtype(want_bank_names or (), fields)
+            arrays = {bn: np.empty(0, dtype[bn]) for bn in dtype.names}
+        else:
+            arrays = {bn: np.concatenate([batch[bn] for batch in batches]) for bn in batches[0].dtype.names}
+
+        if self.cache is not None:
+            self.cache.store(self.path, want_bank_names, arrays, fields)
+            return self.cache.load(self.path, want_bank_names, fields)
+        return arrays
+
+    def write_dst(self, event_list, show_progress=True):
+        """
+        Write events, given as a structured array (one row per event) or an iterable of events.
+
+        Banks whose dtype has the same layout as the C struct (e.g. read by read_dst or read_batches) are copied
+        into the global variables with a single memmove, and the others field by field (missing fields are zero).
+        """
         if self.mode == "r":
             raise io.UnsupportedOperation("not writable")
 
-        got_bank = bank_list.BankList(150)
+        if isinstance(event_list, np.ndarray) and event_list.dtype.names is not None:
+            self._write_array(event_list, show_progress)
+            return
 
-        if show_progress:
-            event_list = tqdm.tqdm(event_list, file=sys.stdout, desc="writing DST")
+        tqdm = _import_tqdm() if show_progress else None
+        if tqdm is not None:
+            event_list = tqdm.tqdm(event_list, file=sys.stdout, desc="writing DST", mininterval=1)
 
         def _get_names(event):
             if isinstance(event, dict):
@@ -227,31 +911,227 @@ class DSTIOWrapper:
             else:
                 raise TypeError(type(event))
 
-        for event in event_list:
-            names = _get_names(event)
+        stats = self.stats
+        with bank_list.borrow(150) as got_bank:
+            for event in event_list:
+                names = _get_names(event)
 
-            got_bank.clear()
-            got_bank.extend(get_id_from_name(names))
+                got_bank.clear()
+                got_bank.extend(get_id_from_name(names))
 
-            for name in names:
-                var = getattr(dst.lib, f"{name}_")
-                for k in _get_names(event[name]):
-                    v = event[name][k]
+                with _globals_lock:
+                    if stats is not None:
+                        t = time.perf_counter()
 
-                    obj = getattr(var, k)
-                    if isinstance(obj, dst.ffi.CData):
-                        cname = dst.ffi.typeof(obj).cname
-                        setattr(var, k, dst.ffi.from_buffer(cname, v))
-                    else:
-                        setattr(var, k, v)
+                    for name in names:
+                        _set_global_variable(name, event[name])
+                    views.invalidate()
 
-            dst.lib.eventWrite(self.in_unit, got_bank._bank_id, 1)
+                    if stats is not None:
+                        t = stats.lap("convert", t)
 
-    def dump(self):
-        pass
+                    dst.lib.eventWrite(self.in_unit, got_bank._bank_id, 1)
+
+                if stats is not None:
+                    stats.lap("write", t)
+                    stats.events += 1
+                    stats.add_banks(
+                        names, sum(c_to_py.get_dtype(_get_global_variable(name)).itemsize for name in names)
+                    )
+
+    def _write_array(self, events, show_progress, progress_step=10000):
+        # (address of the global variable, base pointer of the source, stride, offset, size) for each bank
+        plans = []
+        sources = []
+        for name in events.dtype.names:
+            address, c_dtype, fields = _get_write_plan(name, events.dtype[name])
+            if fields is None and events.flags.c_contiguous:
+                src, stride, offset = events, events.itemsize, events.dtype.fields[name][1]
+            else:
+                # Convert the whole column at once, field by field, into the layout of the C struct.
+                src = np.zeros(len(events), dtype=c_dtype)
+                for f in (c_dtype.names if fields is None else fields):
+                    src[f] = events[name][f]
+                stride, offset = c_dtype.itemsize, 0
+            sources.append(src)
+            plans.append((address, dst.ffi.from_buffer(src.view(np.uint8)), stride, offset, c_dtype.itemsize))
+
+        pbar = None
+        tqdm = _import_tqdm() if show_progress else None
+        if tqdm is not None:
+            pbar = tqdm.tqdm(total=len(events), file=sys.stdout, desc="writing DST")
+
+        stats = self.stats
+        n_bytes = sum(size for *_, size in plans)
+        with bank_list.borrow(150) as got_bank:
+            got_bank.extend(get_id_from_name(events.dtype.names))
+            for i in range(len(events)):
+                with _globals_lock:
+                    if stats is not None:
+                        t = time.perf_counter()
+
+                    for address, base, stride, offset, size in plans:
+                        dst.ffi.memmove(address, base + (i * stride + offset), size)
+                    views.invalidate()
+
+                    if stats is not None:
+                        t = stats.lap("convert", t)
+
+                    dst.lib.eventWrite(self.in_unit, got_bank._bank_id, 1)
+
+                if stats is not None:
+                    stats.lap("write", t)
+                    stats.events += 1
+                    stats.add_banks(events.dtype.names, n_bytes)
+
+                if pbar is not None and (i + 1) % progress_step == 0:
+                    pbar.update(progress_step)
+
+        if pbar is not None:
+            pbar.update(len(events) - pbar.n)
+            pbar.close()
+
+    def skim(self, out, want_bank_names=None, where=None):
+        """
+        Copy the events (from the current position) to `out`, a DSTIOWrapper opened for writing or a path, and
+        return the number of events written.
+
+        Events are read into the bank global variables and written from there by dst2k as they are, without
+        any conversion. Only the banks in `want_bank_names` (all by default) are copied, and events with none
+        of them are dropped. `where` selects events as in read_dst. Without it, the whole copy runs in C.
+        """
+        if self.mode != "r":
+            raise io.UnsupportedOperation("not readable")
+
+        if not isinstance(out, DSTIOWrapper):
+            with open(out, "w") as f:
+                return self.skim(f, want_bank_names, where)
+
+        if out.mode == "r":
+            raise io.UnsupportedOperation("not writable")
+
+        where = _compile_where(where)
+        stats = self.stats
+
+        n_written = 0
+        with bank_list.borrow(150) as want_bank, bank_list.borrow(150) as got_bank:
+            if want_bank_names is None:
+                want_bank.set_all_banks()
+            else:
+                want_bank.extend(get_id_from_name(want_bank_names))
+
+            if where is None:
+                if self._prefetcher is not None:
+                    raise RuntimeError("the events are being read by a prefetching worker")
+
+                counts = dst.ffi.new("int[2]")
+                with _globals_lock:
+                    if stats is not None:
+                        t = time.perf_counter()
+                    rc = dst.lib.pydst_copyEvents(
+                        self.in_unit, out.in_unit, want_bank._bank_id, got_bank._bank_id,
+                        dst.ffi.cast("integer4 *", self.event), counts, counts + 1
+                    )
+                    views.invalidate()
+                    self._position += counts[0]
+                    if stats is not None:
+                        stats.lap("copy", t)
+                        stats.events += counts[0]
+
+                    self._is_end(rc)
+                return counts[1]
+
+            while True:
+                with _globals_lock:
+                    if not self._read_event(want_bank, got_bank):
+                        break
+                    bank_names = get_name_from_id(got_bank.to_numpy())
+                    if want_bank_names is None:
+                        bank_names = _drop_unbuilt_banks(bank_names)
+                    if len(got_bank) == 0 or not self._select(where, bank_names):
+                        continue
+
+                    if stats is not None:
+                        t = time.perf_counter()
+                    dst.lib.eventWrite(out.in_unit, got_bank._bank_id, 1)
+                    if stats is not None:
+                        stats.lap("write", t)
+                    n_written += 1
+
+        return n_written
+
+    def dump(self, file=None, want_bank_names=None, where=None):
+        """
+        Write all the events (from the current position) as text to the file object `file` (stdout by default).
+
+        Banks are formatted straight from read-only views of the bank global variables, with the dumpers in
+        banks.dumpers or field by field for the others. `where` selects events as in read_dst.
+        """
+        if self.mode != "r":
+            raise io.UnsupportedOperation("not readable")
+
+        if file is None:
+            file = sys.stdout
+
+        where = _compile_where(where)
+
+        def consume(bank_names):
+            if where is None or self._select(where, bank_names):
+                for bn in bank_names:
+                    banks.dump(bn, self._get_borrowed_view(bn)[()], file)
+            return _SKIP
+
+        for _ in self._read_events(want_bank_names, consume):
+            pass
+
+
+_bank_table = None
+
+
+def _get_bank_table():
+    """
+    Return (ids, names of ids, names, ids of names) of all the banks known to dst2k, sorted by ids and names.
+    It is built once on first use.
+    """
+    global _bank_table
+    if _bank_table is None:
+        all_banks = bank_list.BankList(150)
+        all_banks.set_all_banks()
+        ids = np.unique(all_banks.to_numpy())
+        names = _get_name_from_id_via_ffi(ids)
+        order = np.argsort(names)
+        _bank_table = ids, names, names[order], ids[order]
+    return _bank_table
+
+
+def _lookup(keys, sorted_keys, values):
+    if len(sorted_keys) == 0:
+        return np.zeros(keys.shape, values.dtype), np.zeros(keys.shape, bool)
+    indices = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return np.array(values[indices]), np.asarray(sorted_keys[indices] == keys)
 
 
 def get_id_from_name(bank_name):
+    bank_name = np.asarray(bank_name, "U")
+    _, _, names, ids = _get_bank_table()
+    ret, found = _lookup(bank_name, names, ids)
+    if not found.all():
+        ret[~found] = _get_id_from_name_via_ffi(bank_name[~found])
+    return ret
+
+
+def get_name_from_id(bank_id):
+    bank_id = np.asarray(bank_id, "i4")
+    ids, names, _, _ = _get_bank_table()
+    ret, found = _lookup(bank_id, ids, names)
+    if not found.all():
+        ret = ret.astype(object)
+        ret[~found] = _get_name_from_id_via_ffi(bank_id[~found])
+        ret = ret.astype(str)
+    return ret
+
+
+def _get_id_from_name_via_ffi(bank_name):
     @np.vectorize
     def _inner(bnm):
         return dst.lib.eventIdFromName(dst.ffi.from_buffer(bnm))
@@ -259,7 +1139,7 @@ def get_id_from_name(bank_name):
     return _inner(np.asarray(bank_name, "S"))
 
 
-def get_name_from_id(bank_id):
+def _get_name_from_id_via_ffi(bank_id):
     size = 32
     text = dst.ffi.new(f'char[{size}]')
 
@@ -0,0 +1,57 @@
+import contextlib
+import heapq
+import os
+from typing import Iterable
+
+from . import event
+
+
+__all__ = ["merge", "fraw1_time"]
+
+
+# time of fraw1 events, as "<bank>.<field>" keys
+fraw1_time = ("fraw1.julian", "fraw1.jsecond", "fraw1.jclkcnt")
+
+
+def _compile_key(key):
+    if callable(key):
+        return key
+
+    fields = [tuple(k.split(".", 1)) for k in ([key] if isinstance(key, str) else key)]
+
+    def _key(e):
+        return tuple(e[bn][f].item() for bn, f in fields)
+    return _key
+
+
+def _with_source(i, events):
+    for e in events:
+        yield i, e
+
+
+def merge(files: Iterable[os.PathLike], key=fraw1_time, want_bank_names=None, where=None, fields=None,
+          with_source=False):
+    """
+    Merge DST files, each already ordered by `key`, into one stream of events ordered by `key`.
+
+    `key` is a function of an event, or a "<bank>.<field>" name or a sequence of them such as the default
+    ("fraw1.julian", "fraw1.jsecond", "fraw1.jclkcnt"). Events with equal keys are yielded in the order of
+    `files`. Only one event per file is held at a time, so the memory use does not depend on the file sizes.
+
+    Events are read as by read_dst(want_bank_names, where=where, fields=fields), so every event must have the
+    banks used by `key`. If `with_source` is True, (index of the file in `files`, event) pairs are yielded.
+    """
+    key = _compile_key(key)
+    files = list(files)
+
+    with contextlib.ExitStack() as stack:
+        streams = []
+        for i, file in enumerate(files):
+            f = stack.enter_context(event.open(file))
+            events = f.read_dst(want_bank_names, where=where, fields=fields)
+            streams.append(_with_source(i, events) if with_source else events)
+
+        if with_source:
+            yield from heapq.merge(*streams, key=lambda item: key(item[1]))
+        else:
+            yield from heapq.merge(*streams, key=key)
@@ -0,0 +1,156 @@
+import builtins
+import concurrent.futures
+import json
+import os
+import pathlib
+import shutil
+
+import numpy as np
+
+from . import event
+from .compression import openers
+
+
+__all__ = ["ShardedWriter"]
+
+
+def _compress(path, compression):
+    """Compress the file `path` into `path`.<compression>, remove `path`, and return the new path."""
+    path = pathlib.Path(path)
+    compressed_path = path.with_name(f"{path.name}.{compression}")
+    with builtins.open(path, "rb") as src, openers[compression](compressed_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    path.unlink()
+    return str(compressed_path)
+
+
+class ShardedWriter:
+    """
+    Write events into DST files ("shards") named `pattern`.format(index=i), e.g. "out/run_{index:04d}.dst".
+    Existing shards and manifests are never overwritten (FileExistsError).
+
+    A new shard is started after `max_events` events or (approximately, checked every `check_every` events)
+    `max_bytes` bytes. Shards are written uncompressed, and each finished shard is compressed to
+    <name>.<compression> ('gz', 'bz2', 'xz' or None) in a process pool of `max_workers` while writing continues.
+    On close, a JSON manifest of the shards is written to `manifest` (manifest.json next to the shards by default).
+    """
+
+    def __init__(self, pattern, max_events=None, max_bytes=None, compression="gz", max_workers=None,
+                 manifest=None, check_every=1000):
+        if compression is not None and compression not in openers:
+            raise ValueError(f"unsupported compression: '{compression}'")
+        if max_events is not None and max_events < 1:
+            raise ValueError(f"Expected max_events >= 1, got {max_events}.")
+        if str(pattern).format(index=0) == str(pattern).format(index=1):
+            raise ValueError(f"Expected a pattern with an {{index}} field, got '{pattern}'.")
+
+        self.pattern = str(pattern)
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.manifest = pathlib.Path(self.pattern).parent / "manifest.json" if manifest is None else manifest
+        self.check_every = check_every
+        self.shards = []  # dicts of index, path, events, bytes and compression
+        self.closed = False
+
+        # fail before writing anything, e.g. when run twice into the same directory
+        self._get_new_path(0)
+        if pathlib.Path(self.manifest).exists():
+            raise FileExistsError(f"[Errno 17] File exists: '{self.manifest}'")
+
+        self._executor = None if compression is None else concurrent.futures.ProcessPoolExecutor(max_workers)
+        self._futures = []
+        self._writer = None
+        self._n_events = 0  # events in the current shard
+        self._n_unchecked = 0  # events written since the size was last checked
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(pattern='{self.pattern}', shards={len(self.shards)})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_writer(self):
+        if self._writer is None:
+            path = self._get_new_path(len(self.shards))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = event.open(path, "w", compression=None)
+            self._n_events = 0
+            self._n_unchecked = 0
+        return self._writer
+
+    def _get_new_path(self, index):
+        # Never overwrite a file, which may be a shard of another run or even a shard being compressed.
+        path = pathlib.Path(self.pattern.format(index=index))
+        for p in [path] + ([] if self.compression is None else [path.with_name(f"{path.name}.{self.compression}")]):
+            if p.exists():
+                raise FileExistsError(f"[Errno 17] File exists: '{p}'")
+        return path
+
+    def _get_room(self):
+        room = self.check_every - self._n_unchecked
+        if self.max_events is None:
+            return room
+        return min(self.max_events - self._n_events, room)
+
+    def _count(self, n):
+        self._n_events += n
+        self._n_unchecked += n
+        if self.max_events is not None and self._n_events >= self.max_events:
+            self._finish_shard()
+        elif self._n_unchecked >= self.check_every:
+            self._n_unchecked = 0
+            if self.max_bytes is not None and os.path.getsize(self._writer.path) >= self.max_bytes:
+                self._finish_shard()
+
+    def _finish_shard(self):
+        path = self._writer.path
+        self._writer.close()
+        self._writer = None
+
+        shard = {
+            "index": len(self.shards), "path": str(path), "events": self._n_events, "bytes": os.path.getsize(path),
+            "compression": self.compression
+        }
+        self.shards.append(shard)
+        if self._executor is not None:
+            self._futures.append((shard, self._executor.submit(_compress, path, self.compression)))
+
+    def write(self, events):
+        """Write events, given as a structured array (one row per event) or an iterable of events."""
+        if self.closed:
+            raise ValueError("I/O operation on closed writer")
+
+        if isinstance(events, np.ndarray) and events.dtype.names is not None:
+            i = 0
+            while i < len(events):
+                n = min(len(events) - i, self._get_room())
+                self._get_writer().write_dst(events[i:i + n], show_progress=False)
+                self._count(n)
+                i += n
+        else:
+            for e in events:
+                self._get_writer().write_dst([e], show_progress=False)
+                self._count(1)
+
+    def close(self):
+        """Finish the last shard, wait for the compression of all the shards, and write the manifest."""
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            if self._writer is not None:
+                self._finish_shard()
+            for shard, future in self._futures:
+                shard["path"] = future.result()
+                shard["bytes"] = os.path.getsize(shard["path"])
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+
+        with builtins.open(self.manifest, "w") as f:
+            json.dump({"events": sum(s["events"] for s in self.shards), "shards": self.shards}, f, indent=2)
@@ -0,0 +1,57 @@
+import collections
+import time
+
+
+__all__ = ["IOStats"]
+
+
+class IOStats:
+    """
+    Cumulative timings and counters of DSTIOWrapper, enabled by open(..., stats=True).
+
+    `times` is a dict of stage -> seconds, where the stages are
+        read    : eventRead of dst2k (I/O and decoding of banks into the global variables)
+        lookup  : bank ids -> names of the banks got
+        where   : evaluation of the where predicate
+        convert : copies between the global variables and Python/NumPy objects
+        write   : eventWrite of dst2k
+        copy    : eventRead and eventWrite of dst2k in the loop of skim() written in C
+    `events` is the number of events read or written, `bytes` the number of bytes of banks copied by convert,
+    and `banks` a Counter of bank name -> number of banks copied.
+
+    `hook(stage, seconds)`, if given, is called at every measurement.
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.reset()
+
+    def reset(self):
+        self.times = collections.defaultdict(float)
+        self.events = 0
+        self.bytes = 0
+        self.banks = collections.Counter()
+
+    def add_time(self, stage, seconds):
+        self.times[stage] += seconds
+        if self.hook is not None:
+            self.hook(stage, seconds)
+
+    def lap(self, stage, start):
+        """Add the time since `start` (a time.perf_counter() value) to `stage`, and return the current time."""
+        now = time.perf_counter()
+        self.add_time(stage, now - start)
+        return now
+
+    def add_banks(self, bank_names, n_bytes):
+        self.banks.update(map(str, bank_names))
+        self.bytes += n_bytes
+
+    def to_dict(self):
+        return {
+            "times": dict(self.times), "events": self.events, "bytes": self.bytes, "banks": dict(self.banks)
+        }
+
+    def __repr__(self):
+        times = ", ".join(f"{stage}={seconds:.3g}s" for stage, seconds in self.times.items())
+        return f"{self.__class__.__name__}(events={self.events}, bytes={self.bytes}, {times})"
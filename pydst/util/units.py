@@ -0,0 +1,78 @@
+import threading
+
+from .. import _dst as dst
+
+
+__all__ = ["UnitPool", "UnitsExhaustedError", "pool"]
+
+
+class UnitsExhaustedError(RuntimeError):
+    pass
+
+
+class UnitPool:
+    """
+    Thread-safe pool of the unit numbers of dst2k, starting from `first`.
+
+    Released units are reused, the most recently released first. If `max_units` units are in use, acquire() waits
+    for one to be released, up to `timeout` seconds (forever if None), or raises UnitsExhaustedError at once
+    if `block` is False. The shared `pool` is capped at the units dst2k supports, and does not block, so that
+    opening too many files raises instead of waiting forever in a single thread.
+    """
+
+    def __init__(self, first=1, max_units=None, block=True, timeout=None):
+        self.first = first
+        self.max_units = max_units
+        self.block = block
+        self.timeout = timeout
+        self._free = []
+        self._next = first
+        self._in_use = set()
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(in_use={len(self._in_use)}, max_units={self.max_units}, "
+            f"block={self.block}, timeout={self.timeout})"
+        )
+
+    def _available(self):
+        return self.max_units is None or len(self._in_use) < self.max_units
+
+    def acquire(self, block=None, timeout=None):
+        block = self.block if block is None else block
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._condition:
+            if not self._condition.wait_for(self._available, timeout if block else 0):
+                raise UnitsExhaustedError(f"all the {self.max_units} units are in use")
+
+            if len(self._free) > 0:
+                unit = self._free.pop()
+            else:
+                unit = self._next
+                self._next += 1
+            self._in_use.add(unit)
+            return unit
+
+    def release(self, unit):
+        with self._condition:
+            if unit not in self._in_use:
+                raise ValueError(f"unit {unit} is not in use")
+            self._in_use.remove(unit)
+            self._free.append(unit)
+            self._condition.notify()
+
+    @property
+    def in_use(self):
+        return len(self._in_use)
+
+
+def _get_max_units(first):
+    # None if the limit of dst2k is unknown
+    n = dst.lib.pydst_getMaxUnits()
+    return None if n <= first else n - first
+
+
+# shared by all DSTIOWrapper objects (unit 0 is not used)
+pool = UnitPool(max_units=_get_max_units(1), block=False)
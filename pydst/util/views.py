@@ -0,0 +1,145 @@
+__all__ = ["StaleViewError", "BorrowedEvent", "BorrowedBank", "LazyEvent", "LazyBank"]
+
+
+class StaleViewError(RuntimeError):
+    pass
+
+
+# Incremented every time the bank global variables of dst2k are overwritten or a reader is closed. It is not
+# per reader, since the global variables are shared by all the readers of the process.
+_generation = 0
+
+
+def invalidate():
+    """Make all the views taken so far stale."""
+    global _generation
+    _generation += 1
+
+
+class _EventView:
+    __slots__ = ("_reader", "_generation", "_banks")
+
+    def __init__(self, reader, banks):
+        self._reader = reader
+        self._generation = _generation
+        self._banks = banks
+
+    def _check(self):
+        if self._reader is not None and self._generation != _generation:
+            raise StaleViewError("the event has been overwritten by another event")
+
+    def __contains__(self, bank_name):
+        return bank_name in self._banks
+
+    def __iter__(self):
+        return iter(self._banks)
+
+    def __len__(self):
+        return len(self._banks)
+
+    def keys(self):
+        return self._banks.keys()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self._banks)})"
+
+
+class BorrowedEvent(_EventView):
+    """
+    Read-only views of the bank global variables of dst2k for the event just read.
+
+    They are valid only until any reader reads an event, any writer writes one, or a reader is closed; touching
+    them afterwards raises StaleViewError. Arrays taken out of them are not guarded, so copy them if they have to
+    be kept.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, bank_name):
+        self._check()
+        return BorrowedBank(self, self._banks[bank_name])
+
+
+class BorrowedBank:
+    __slots__ = ("_event", "_view")
+
+    def __init__(self, event, view):
+        self._event = event
+        self._view = view
+
+    def __getitem__(self, field_name):
+        self._event._check()
+        return self._view[field_name]
+
+    def __getattr__(self, field_name):
+        if field_name.startswith("_") or field_name not in self._view.dtype.names:
+            raise AttributeError(field_name)
+        return self[field_name]
+
+    @property
+    def dtype(self):
+        return self._view.dtype
+
+    def copy(self):
+        self._event._check()
+        return self._view.copy()
+
+
+class LazyEvent(_EventView):
+    """
+    Event whose bank fields are copied out of the bank global variables of dst2k on first access and memoized.
+
+    Fields not accessed yet can be decoded only until the bank global variables are overwritten, as for
+    BorrowedEvent (StaleViewError afterwards).
+    Call materialize() to decode the remaining fields, so that the event can be kept after the reader advances.
+    """
+    __slots__ = ()
+
+    def __init__(self, reader, banks):
+        super().__init__(reader, {})
+        self._banks = {bn: LazyBank(self, view) for bn, view in banks.items()}
+
+    def __getitem__(self, bank_name):
+        return self._banks[bank_name]
+
+    def materialize(self):
+        for bank in self._banks.values():
+            bank.materialize()
+        self._reader = None
+        return self
+
+
+class LazyBank:
+    __slots__ = ("_event", "_view", "_values")
+
+    def __init__(self, event, view):
+        self._event = event
+        self._view = view
+        self._values = {}
+
+    def __getitem__(self, field_name):
+        if field_name not in self._values:
+            self._event._check()
+            self._values[field_name] = self._view[field_name].copy()
+        return self._values[field_name]
+
+    def __getattr__(self, field_name):
+        if field_name.startswith("_") or field_name not in self._view.dtype.names:
+            raise AttributeError(field_name)
+        return self[field_name]
+
+    def __contains__(self, field_name):
+        return field_name in self._view.dtype.names
+
+    def __iter__(self):
+        return iter(self._view.dtype.names)
+
+    def keys(self):
+        return self._view.dtype.names
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(decoded={list(self._values)})"
+
+    def materialize(self):
+        for field_name in self._view.dtype.names:
+            self[field_name]
+        return self
@@ -27,8 +27,7 @@ setup(
     install_requires=[
         "numpy",
         "pycparser",
-        "cffi",
-        "more-itertools"
+        "cffi"
     ],
     cmdclass={"build_py": build_py}
 )
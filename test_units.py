@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+from pydst.util.units import UnitPool, UnitsExhaustedError
+
+
+def test_reuse():
+    pool = UnitPool(first=1)
+    assert [pool.acquire() for _ in range(3)] == [1, 2, 3]
+    pool.release(2)
+    assert pool.acquire() == 2
+    assert pool.acquire() == 4
+    assert pool.in_use == 4
+
+
+def test_cap():
+    pool = UnitPool(max_units=2, block=False)
+    pool.acquire()
+    unit = pool.acquire()
+    with pytest.raises(UnitsExhaustedError):
+        pool.acquire()
+    pool.release(unit)
+    assert pool.acquire() == unit
+
+
+def test_timeout():
+    pool = UnitPool(max_units=1, timeout=0.05)
+    pool.acquire()
+    start = time.perf_counter()
+    with pytest.raises(UnitsExhaustedError):
+        pool.acquire()
+    assert time.perf_counter() - start >= 0.05
+
+
+def test_blocking_acquire_waits_for_release():
+    pool = UnitPool(max_units=1)
+    unit = pool.acquire()
+    threading.Timer(0.05, pool.release, [unit]).start()
+    assert pool.acquire(timeout=5) == unit
+
+
+def test_release_unknown_unit():
+    pool = UnitPool()
+    with pytest.raises(ValueError):
+        pool.release(1)
+    unit = pool.acquire()
+    pool.release(unit)
+    with pytest.raises(ValueError):
+        pool.release(unit)